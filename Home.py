@@ -1,13 +1,11 @@
 import streamlit as st
-import pandas as pd
+import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-import json
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 from utils.ai_utils import AILendingAssistant
 from utils.database import LendingDatabase
+from utils.charts import risk_heatmap
 
 # Page configuration
 st.set_page_config(
@@ -24,40 +22,128 @@ def init_ai_assistant():
 
 @st.cache_resource
 def init_database():
-    return LendingDatabase()
+    # Connected once; the connection is reused across reruns and sessions
+    db = LendingDatabase()
+    db.connect()
+    return db
 
 ai_assistant = init_ai_assistant()
 db = init_database()
 
+# Cached dashboard queries. Every loader takes the database modification time
+# so a write to lending.db invalidates the cached results on the next rerun.
+# db is a cache_resource, so its connection stays open (and its page and
+# statement caches warm) across reruns.
+@st.cache_data(ttl=60, show_spinner=False)
+def load_metrics(db_mtime):
+    return db.query_one("""
+        SELECT
+            (SELECT COUNT(*) FROM customers),
+            (SELECT n FROM kyc_status_counts WHERE verification_status = 'approved'),
+            (SELECT AVG(score) FROM credit_scores),
+            (SELECT SUM(outstanding_amount) FROM collections),
+            (SELECT COUNT(*) FROM customers WHERE customer_type = 'individual'),
+            (SELECT COUNT(*) FROM customers WHERE customer_type = 'business'),
+            (SELECT COUNT(*) FROM marketing_campaigns WHERE status = 'active')
+    """)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_customer_distribution(db_mtime):
+    return db.query_df('SELECT customer_type AS "Type", COUNT(*) AS "Count" FROM customers GROUP BY customer_type')
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_kyc_status(db_mtime):
+    return db.query_df('SELECT verification_status AS "Status", n AS "Count" FROM kyc_status_counts WHERE n > 0')
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_collections(db_mtime):
+    # Customer name and risk score (days overdue vs outstanding amount) are computed by SQLite
+    return db.query_df("""
+        SELECT COALESCE(c.company_name, c.first_name || ' ' || c.last_name) AS "Customer",
+               col.outstanding_amount AS "Outstanding",
+               col.days_overdue AS "Days Overdue",
+               col.collection_stage AS "Stage",
+               (col.days_overdue / 30.0) * (col.outstanding_amount / 1000.0) AS "Risk Score"
+        FROM collections col
+        JOIN customers c ON col.customer_id = c.id
+    """)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_recent_activity(db_mtime):
+    # Latest verifications and service interactions in one round-trip, split by kind
+    recent = db.query_df("""
+        SELECT * FROM (
+            SELECT 'kyc' AS kind, customer_display_name AS "Customer",
+                   verification_status AS detail, NULL AS "Sentiment"
+            FROM kyc_kyb_data
+            ORDER BY created_at DESC
+            LIMIT 5
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'service' AS kind,
+                   COALESCE(c.company_name, c.first_name || ' ' || c.last_name) AS "Customer",
+                   cs.subject AS detail, cs.sentiment_score AS "Sentiment"
+            FROM customer_service cs
+            JOIN customers c ON cs.customer_id = c.id
+            ORDER BY cs.created_at DESC
+            LIMIT 5
+        )
+    """)
+    is_kyc = recent.pop('kind') == 'kyc'
+    recent_kyc = recent[is_kyc].drop(columns='Sentiment').rename(columns={'detail': 'Status'})
+    recent_service = recent[~is_kyc].rename(columns={'detail': 'Subject'})
+    return recent_kyc.reset_index(drop=True), recent_service.reset_index(drop=True)
+
+# Figures are built once per database state and reused as-is on later reruns;
+# cache_resource hands back the same object instead of unpickling a copy.
+# The pie and bar print their values on the chart, so hover handling is switched
+# off; the binned heatmap keeps hover to read cell counts.
+@st.cache_resource(ttl=60, show_spinner=False)
+def build_customer_pie(db_mtime):
+    fig = px.pie(load_customer_distribution(db_mtime), values='Count', names='Type', title="Individual vs Business Customers")
+    fig.update_traces(textinfo='label+value+percent', hoverinfo='skip', hovertemplate=None)
+    fig.update_layout(hovermode=False)
+    return fig
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def build_kyc_bar(db_mtime):
+    fig = px.bar(load_kyc_status(db_mtime), x='Status', y='Count', title="Verification Status Distribution", text_auto=True)
+    fig.update_traces(hoverinfo='skip', hovertemplate=None)
+    fig.update_layout(hovermode=False)
+    return fig
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def build_collections_heatmap(db_mtime):
+    df_collections = load_collections(db_mtime)
+    return risk_heatmap(
+        df_collections['Days Overdue'],
+        df_collections['Outstanding'],
+        title="Collections Risk Heatmap (Days Overdue vs Outstanding Amount)"
+    )
+
+db_mtime = db.last_modified()
+
 # Main dashboard content
 st.title("🏦 AI Lending Platform Dashboard")
 st.markdown("Welcome to the AI-powered lending platform. Navigate through different modules using the sidebar.")
 
-# Get database connection and summary data
-conn = db.connect()
-cursor = conn.cursor()
+# Key metrics (dashboard and sidebar) in a single round-trip
+(total_customers, approved_kyc, avg_score, total_collections,
+ individual_count, business_count, active_campaigns) = load_metrics(db_mtime)
 
-# Key metrics
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    cursor.execute("SELECT COUNT(*) FROM customers")
-    total_customers = cursor.fetchone()[0]
     st.metric("Total Customers", total_customers)
 
 with col2:
-    cursor.execute("SELECT COUNT(*) FROM kyc_kyb_data WHERE verification_status = 'approved'")
-    approved_kyc = cursor.fetchone()[0]
     st.metric("Approved KYC/KYB", approved_kyc)
 
 with col3:
-    cursor.execute("SELECT AVG(score) FROM credit_scores")
-    avg_score = cursor.fetchone()[0]
     st.metric("Avg Credit Score", f"{avg_score:.0f}" if avg_score else "N/A")
 
 with col4:
-    cursor.execute("SELECT SUM(outstanding_amount) FROM collections")
-    total_collections = cursor.fetchone()[0]
     st.metric("Total Collections", f"€{total_collections:,.0f}" if total_collections else "€0")
 
 st.markdown("---")
@@ -67,109 +153,56 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("Customer Distribution")
-    cursor.execute("SELECT customer_type, COUNT(*) as count FROM customers GROUP BY customer_type")
-    customer_data = cursor.fetchall()
-    df_customers = pd.DataFrame(customer_data, columns=['Type', 'Count'])
-    
-    fig_pie = px.pie(df_customers, values='Count', names='Type', title="Individual vs Business Customers")
-    st.plotly_chart(fig_pie, use_container_width=True)
+    fig_pie = build_customer_pie(db_mtime)
+    st.plotly_chart(fig_pie, use_container_width=True, key="customer_pie")
 
 with col2:
     st.subheader("KYC/KYB Status")
-    cursor.execute("SELECT verification_status, COUNT(*) as count FROM kyc_kyb_data GROUP BY verification_status")
-    kyc_data = cursor.fetchall()
-    df_kyc = pd.DataFrame(kyc_data, columns=['Status', 'Count'])
-    
-    fig_bar = px.bar(df_kyc, x='Status', y='Count', title="Verification Status Distribution")
-    st.plotly_chart(fig_bar, use_container_width=True)
+    fig_bar = build_kyc_bar(db_mtime)
+    st.plotly_chart(fig_bar, use_container_width=True, key="kyc_bar")
 
 # Collections heatmap
 st.subheader("Collections Risk Heatmap")
-cursor.execute("""
-    SELECT c.first_name, c.last_name, c.company_name, col.outstanding_amount, col.days_overdue, col.collection_stage
-    FROM collections col
-    JOIN customers c ON col.customer_id = c.id
-""")
-collections_data = cursor.fetchall()
-
-if collections_data:
-    df_collections = pd.DataFrame(collections_data, columns=[
-        'First Name', 'Last Name', 'Company', 'Outstanding', 'Days Overdue', 'Stage'
-    ])
-    df_collections['Customer'] = df_collections.apply(
-        lambda x: x['Company'] if pd.notna(x['Company']) else f"{x['First Name']} {x['Last Name']}", axis=1
-    )
-    
-    # Create risk score based on days overdue and amount
-    df_collections['Risk Score'] = (df_collections['Days Overdue'] / 30) * (df_collections['Outstanding'] / 1000)
-    
-    fig_heatmap = px.density_heatmap(
-        df_collections, 
-        x='Days Overdue', 
-        y='Outstanding',
-        title="Collections Risk Heatmap (Days Overdue vs Outstanding Amount)"
-    )
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+df_collections = load_collections(db_mtime)
+
+if not df_collections.empty:
+    fig_heatmap = build_collections_heatmap(db_mtime)
+    st.plotly_chart(fig_heatmap, use_container_width=True, key="collections_heatmap")
     
     # Collections table
     st.subheader("Collections Summary Table")
-    display_df = df_collections[['Customer', 'Outstanding', 'Days Overdue', 'Stage']].copy()
-    display_df['Outstanding'] = display_df['Outstanding'].apply(lambda x: f"€{x:,.2f}")
-    st.dataframe(display_df, use_container_width=True)
+    display_df = df_collections[['Customer', 'Outstanding', 'Days Overdue', 'Stage']]
+    # Formatted client-side; the column stays numeric so sorting works
+    st.dataframe(
+        display_df,
+        column_config={'Outstanding': st.column_config.NumberColumn('Outstanding', format='euro')},
+        use_container_width=True
+    )
 
 # Recent activity
 st.markdown("---")
 st.subheader("Recent Activity")
+recent_kyc, recent_service = load_recent_activity(db_mtime)
 
 col1, col2 = st.columns(2)
 
 with col1:
     st.write("**Latest Customer Verifications**")
-    cursor.execute("""
-        SELECT c.first_name, c.last_name, k.verification_status, k.created_at
-        FROM kyc_kyb_data k
-        JOIN customers c ON k.customer_id = c.id
-        ORDER BY k.created_at DESC
-        LIMIT 5
-    """)
-    recent_kyc = cursor.fetchall()
-    
-    if recent_kyc:
-        for row in recent_kyc:
-            name = f"{row[0]} {row[1]}"
-            status = row[2]
-            date = row[3]
-            
-            if status == 'approved':
-                st.success(f"✅ {name} - {status}")
-            elif status == 'pending':
-                st.warning(f"⏳ {name} - {status}")
-            else:
-                st.error(f"❌ {name} - {status}")
+    if not recent_kyc.empty:
+        status = recent_kyc['Status']
+        recent_kyc.insert(0, '', np.select(
+            [status == 'approved', status == 'pending'], ['✅', '⏳'], default='❌'
+        ))
+        st.dataframe(recent_kyc, hide_index=True, use_container_width=True)
 
 with col2:
     st.write("**Recent Customer Service Interactions**")
-    cursor.execute("""
-        SELECT c.first_name, c.last_name, cs.subject, cs.sentiment_score
-        FROM customer_service cs
-        JOIN customers c ON cs.customer_id = c.id
-        ORDER BY cs.created_at DESC
-        LIMIT 5
-    """)
-    recent_service = cursor.fetchall()
-    
-    if recent_service:
-        for row in recent_service:
-            name = f"{row[0]} {row[1]}"
-            subject = row[2]
-            sentiment = row[3]
-            
-            if sentiment and sentiment > 0.5:
-                st.success(f"😊 {name} - {subject}")
-            elif sentiment and sentiment < -0.5:
-                st.error(f"😞 {name} - {subject}")
-            else:
-                st.info(f"😐 {name} - {subject}")
+    if not recent_service.empty:
+        sentiment = recent_service.pop('Sentiment')
+        recent_service.insert(0, '', np.select(
+            [sentiment > 0.5, sentiment < -0.5], ['😊', '😞'], default='😐'
+        ))
+        st.dataframe(recent_service, hide_index=True, use_container_width=True)
 
 # System status
 st.markdown("---")
@@ -186,8 +219,6 @@ with col3:
 with col4:
     st.info("🔵 Last Update: " + datetime.now().strftime("%H:%M"))
 
-db.close()
-
 # Sidebar information
 with st.sidebar:
     st.markdown("### Navigation")
@@ -212,25 +243,9 @@ with st.sidebar:
     
     st.markdown("### Quick Stats")
     
-    # Create new connection for sidebar stats
-    sidebar_conn = db.connect()
-    sidebar_cursor = sidebar_conn.cursor()
-    
-    # Quick stats
-    sidebar_cursor.execute("SELECT COUNT(*) FROM customers WHERE customer_type = 'individual'")
-    individual_count = sidebar_cursor.fetchone()[0]
-    
-    sidebar_cursor.execute("SELECT COUNT(*) FROM customers WHERE customer_type = 'business'")
-    business_count = sidebar_cursor.fetchone()[0]
-    
-    sidebar_cursor.execute("SELECT COUNT(*) FROM marketing_campaigns WHERE status = 'active'")
-    active_campaigns = sidebar_cursor.fetchone()[0]
-    
     st.metric("Individual Customers", individual_count)
     st.metric("Business Customers", business_count)
     st.metric("Active Campaigns", active_campaigns)
-    
-    sidebar_conn.close()
 
 # Footer
 st.markdown("---")
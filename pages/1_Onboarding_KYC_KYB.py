@@ -1,10 +1,7 @@
 import streamlit as st
-import pandas as pd
-import json
-import sqlite3
-from datetime import datetime
 import os
 import sys
+import orjson
 
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,105 +22,141 @@ def init_ai_assistant():
 
 @st.cache_resource
 def init_database():
-    return LendingDatabase()
+    # Connected once; the connection is reused across reruns and sessions
+    db = LendingDatabase()
+    db.connect()
+    return db
 
 ai_assistant = init_ai_assistant()
 db = init_database()
 
+# Module-level SQL with a bound LIMIT: the text never changes between reruns, so
+# sqlite3's per-connection statement cache reuses the compiled statement
+RECENT_VERIFICATIONS_LIMIT = 10
+RECENT_VERIFICATIONS_SQL = """
+    SELECT customer AS "Customer", type AS "Type", status AS "Status",
+           risk_score AS "Risk Score", created_at AS "Date"
+    FROM v_recent_verifications
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+# Keyed by the database modification time, so new verifications show up on the
+# next rerun while chat reruns are served from the cache
+@st.cache_data(ttl=30, show_spinner=False)
+def load_status_counts(db_mtime):
+    # Read from the trigger-maintained rollup and pivoted in SQL: one row of
+    # (approved, pending, rejected, total)
+    return db.query_one("""
+        SELECT COALESCE(SUM(CASE WHEN verification_status = 'approved' THEN n END), 0),
+               COALESCE(SUM(CASE WHEN verification_status = 'pending' THEN n END), 0),
+               COALESCE(SUM(CASE WHEN verification_status = 'rejected' THEN n END), 0),
+               COALESCE(SUM(n), 0)
+        FROM kyc_status_counts
+    """)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_recent_verifications(db_mtime):
+    # Ten rows go straight to st.dataframe as dicts; no DataFrame needed
+    return [dict(row) for row in db.connect().execute(RECENT_VERIFICATIONS_SQL, (RECENT_VERIFICATIONS_LIMIT,))]
+
+# Verification notes matching a search, newest first. The FTS index finds the
+# row ids; they are bound as one JSON array so the statement text stays constant.
+NOTES_SEARCH_SQL = """
+    SELECT customer_display_name AS "Customer", verification_type AS "Type",
+           verification_status AS "Status", verification_notes AS "Notes", created_at AS "Date"
+    FROM kyc_kyb_data
+    WHERE id IN (SELECT value FROM json_each(?))
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+@st.cache_data(ttl=30, show_spinner=False)
+def search_verification_notes(text, db_mtime):
+    ids = db.search_ids("kyc_notes_fts", text)
+    if not ids:
+        return []
+    return [dict(row) for row in db.connect().execute(NOTES_SEARCH_SQL, (orjson.dumps(ids).decode(), RECENT_VERIFICATIONS_LIMIT))]
+
 st.title("👤 KYC/KYB Customer Onboarding")
 st.markdown("AI-powered customer verification and onboarding process")
 
 # Customer type selection
 customer_type = st.selectbox("Select Customer Type:", ["individual", "business"])
 
-# Chat interface
-st.subheader(f"{'KYC' if customer_type == 'individual' else 'KYB'} Chat Assistant")
-
-# Initialize chat history
-if f"chat_history_{customer_type}" not in st.session_state:
-    st.session_state[f"chat_history_{customer_type}"] = []
-
-# Display chat history
-for message in st.session_state[f"chat_history_{customer_type}"]:
-    with st.chat_message(message["role"]):
-        st.write(message["content"])
-
-# Chat input
-if prompt := st.chat_input(f"Ask about {customer_type} onboarding requirements..."):
-    # Add user message to chat history
-    st.session_state[f"chat_history_{customer_type}"].append({"role": "user", "content": prompt})
+# The chat reruns as a fragment, so sending a message doesn't re-query the
+# status overview and verifications below
+@st.fragment
+def kyc_chat(customer_type):
+    # Chat interface
+    st.subheader(f"{'KYC' if customer_type == 'individual' else 'KYB'} Chat Assistant")
+    
+    # Initialize chat history
+    if f"chat_history_{customer_type}" not in st.session_state:
+        st.session_state[f"chat_history_{customer_type}"] = []
+    
+    # Chat input; the new message joins the history before it is rendered, so
+    # every turn is drawn once by the loop below
+    prompt = st.chat_input(f"Ask about {customer_type} onboarding requirements...")
+    if prompt:
+        st.session_state[f"chat_history_{customer_type}"].append({"role": "user", "content": prompt})
     
-    with st.chat_message("user"):
-        st.write(prompt)
+    # Display chat history
+    for message in st.session_state[f"chat_history_{customer_type}"]:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
     
-    # Get AI response
-    with st.chat_message("assistant"):
-        with st.spinner("Processing..."):
-            response = ai_assistant.kyc_kyb_chat(
+    if prompt:
+        # Get AI response
+        with st.chat_message("assistant"):
+            response = st.write_stream(ai_assistant.kyc_kyb_chat_stream(
                 prompt, 
                 customer_type, 
                 st.session_state[f"chat_history_{customer_type}"][:-1]
-            )
-            st.write(response)
+            ))
+        
+        # Add assistant response to chat history
+        st.session_state[f"chat_history_{customer_type}"].append({"role": "assistant", "content": response})
     
-    # Add assistant response to chat history
-    st.session_state[f"chat_history_{customer_type}"].append({"role": "assistant", "content": response})
+    # Clear chat button
+    if st.button("Clear Chat History"):
+        st.session_state[f"chat_history_{customer_type}"] = []
+        st.rerun(scope="fragment")
 
-# Clear chat button
-if st.button("Clear Chat History"):
-    st.session_state[f"chat_history_{customer_type}"] = []
-    st.rerun()
+kyc_chat(customer_type)
 
 # KYC/KYB Status Overview
 st.markdown("---")
 st.subheader("Verification Status Overview")
 
-conn = db.connect()
-cursor = conn.cursor()
-
 # Get KYC/KYB statistics
-cursor.execute("""
-    SELECT verification_status, COUNT(*) as count 
-    FROM kyc_kyb_data 
-    GROUP BY verification_status
-""")
-status_data = cursor.fetchall()
-
-if status_data:
+approved, pending, rejected, total_verifications = load_status_counts(db.last_modified())
+
+if total_verifications:
     col1, col2, col3 = st.columns(3)
     
-    status_dict = dict(status_data)
-    
     with col1:
-        st.metric("Approved", status_dict.get('approved', 0))
+        st.metric("Approved", approved)
     with col2:
-        st.metric("Pending", status_dict.get('pending', 0))
+        st.metric("Pending", pending)
     with col3:
-        st.metric("Rejected", status_dict.get('rejected', 0))
+        st.metric("Rejected", rejected)
 
 # Recent verifications table
 st.subheader("Recent Verifications")
-cursor.execute("""
-    SELECT c.first_name, c.last_name, c.company_name, k.verification_type, 
-           k.verification_status, k.risk_score, k.created_at
-    FROM kyc_kyb_data k
-    JOIN customers c ON k.customer_id = c.id
-    ORDER BY k.created_at DESC
-    LIMIT 10
-""")
-recent_verifications = cursor.fetchall()
+recent_verifications = load_recent_verifications(db.last_modified())
 
 if recent_verifications:
-    df_verifications = pd.DataFrame(recent_verifications, columns=[
-        'First Name', 'Last Name', 'Company', 'Type', 'Status', 'Risk Score', 'Date'
-    ])
-    df_verifications['Customer'] = df_verifications.apply(
-        lambda x: x['Company'] if pd.notna(x['Company']) else f"{x['First Name']} {x['Last Name']}", axis=1
-    )
-    display_df = df_verifications[['Customer', 'Type', 'Status', 'Risk Score', 'Date']]
-    st.dataframe(display_df, use_container_width=True)
+    st.dataframe(recent_verifications, use_container_width=True)
+
+notes_search = st.text_input("Search verification notes:", "")
+if notes_search:
+    note_matches = search_verification_notes(notes_search, db.last_modified())
+    if note_matches:
+        st.dataframe(note_matches, use_container_width=True)
+    else:
+        st.info(f"No verification notes match '{notes_search}'.")
 
-db.close()
 
 # Sidebar information
 with st.sidebar:
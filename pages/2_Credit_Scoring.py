@@ -1,19 +1,19 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-import json
-import sqlite3
 from datetime import datetime
+import math
 import os
 import sys
-import numpy as np
 
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.ai_utils import AILendingAssistant
 from utils.database import LendingDatabase
 from utils.credit_scoring import CreditScoringModel
+from utils.charts import binned_histogram, histogram_bars
 
 # Page configuration
 st.set_page_config(
@@ -29,7 +29,10 @@ def init_ai_assistant():
 
 @st.cache_resource
 def init_database():
-    return LendingDatabase()
+    # Connected once; the connection is reused across reruns and sessions
+    db = LendingDatabase()
+    db.connect()
+    return db
 
 @st.cache_resource
 def init_credit_model():
@@ -41,29 +44,354 @@ ai_assistant = init_ai_assistant()
 db = init_database()
 credit_model = init_credit_model()
 
+# Score history is paged in SQL; only the histogram bin counts cover every score
+SCORES_PAGE_SIZE = 500
+SCORE_BINS = 20
+
+# Euro amounts in the bank statement metrics
+format_eur = "€{:,.2f}".format
+
+# Credit scores are reported on the 300-850 scale
+SCORE_RANGE = (300, 850)
+
+# Bank statement risk score weights for overdrafts, returned payments and the
+# gambling and irregular income flags, applied as one dot product
+RISK_WEIGHTS = np.array([2, 3, 5, 3])
+
+# Customer list shared by the selector and the score history; keyed by the
+# database modification time so new rows show up on the next rerun
+@st.cache_data(ttl=60, show_spinner=False)
+def load_customers(db_mtime):
+    return db.query_df("""
+        SELECT id, name, email, name || ' (' || email || ')' AS label
+        FROM (
+            SELECT id, COALESCE(company_name, first_name || ' ' || last_name) AS name, email
+            FROM customers
+        )
+    """)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_customer_options(db_mtime):
+    customers_df = load_customers(db_mtime)
+    return dict(zip(customers_df['label'], customers_df['id'].tolist()))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_score_page(page, db_mtime):
+    # Names come from the cached customer list rather than a second pass over customers
+    scores_df = db.query_df("""
+        SELECT customer_id, score AS "Score", score_date AS "Date"
+        FROM credit_scores
+        ORDER BY score_date DESC
+        LIMIT ? OFFSET ?
+    """, params=(SCORES_PAGE_SIZE, (page - 1) * SCORES_PAGE_SIZE), parse_dates=['Date'])
+    names = load_customers(db_mtime).set_index('id')['name']
+    scores_df['Customer'] = scores_df['customer_id'].map(names)
+    return scores_df.dropna(subset=['Customer'])
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_score_bins(db_mtime):
+    # Scores are integers in SCORE_RANGE; 850 falls into the last bin as with np.histogram,
+    # and scores outside the range are clamped into the first or last bin
+    low, high = SCORE_RANGE
+    bins_df = db.query_df("""
+        SELECT MAX(0, MIN((score - ?) * ? / ?, ? - 1)) AS bin, COUNT(*) AS count
+        FROM credit_scores
+        GROUP BY bin
+    """, params=(low, SCORE_BINS, high - low, SCORE_BINS))
+    # An empty table gives no rows (and an object-typed bin column), hence the casts
+    return np.bincount(bins_df['bin'].astype(int), weights=bins_df['count'], minlength=SCORE_BINS).astype(int)
+
+# Batch scoring inputs: the latest bank statement and credit score per customer,
+# with the risk indicators unpacked in SQL. Single-customer scoring reads only
+# these inputs from get_customer_data, so both paths score customers the same.
+@st.cache_data(ttl=60, show_spinner=False)
+def load_batch_inputs(db_mtime):
+    return db.query_df("""
+        SELECT c.id, COALESCE(c.company_name, c.first_name || ' ' || c.last_name) AS name, c.email,
+               bs.monthly_income, bs.monthly_expenses, bs.balance,
+               json_extract(bs.risk_indicators, '$.overdrafts') AS overdrafts,
+               json_extract(bs.risk_indicators, '$.returned_payments') AS returned_payments,
+               json_extract(bs.risk_indicators, '$.gambling_transactions') AS gambling_transactions,
+               json_extract(bs.risk_indicators, '$.irregular_income') AS irregular_income,
+               (SELECT cs.score FROM credit_scores cs WHERE cs.customer_id = c.id
+                ORDER BY cs.score_date DESC LIMIT 1) AS existing_credit_score
+        FROM customers c
+        LEFT JOIN bank_statements bs ON bs.id = (
+            SELECT id FROM bank_statements WHERE customer_id = c.id
+            ORDER BY statement_date DESC LIMIT 1
+        )
+    """)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_customer_data(customer_id, db_mtime):
+    return ai_assistant.get_customer_data(customer_id)
+
+# Predictions only change with the customer's data or the model; retraining
+# clears both caches
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def predict_customer(customer_id, db_mtime):
+    return credit_model.predict_credit_score(load_customer_data(customer_id, db_mtime))
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def score_all_customers(db_mtime):
+    # One query for the inputs and one predict_proba call for every customer
+    batch_df = load_batch_inputs(db_mtime)
+    predictions = credit_model.predict_batch(batch_df)
+    return pd.DataFrame({
+        'Customer': batch_df['name'],
+        'Email': batch_df['email'],
+        'ML Credit Score': predictions['credit_score'],
+        'Risk Level': predictions['risk_level'],
+        'Good Credit Probability': predictions['good_credit_probability'].map('{:.1%}'.format)
+    })
+
+# Score gauges. The band definitions are allocated once and the figures are
+# cached per score, so reselecting a customer reuses the built figure.
+ML_GAUGE_STEPS = [
+    {'range': [300, 580], 'color': "red"},
+    {'range': [580, 670], 'color': "orange"},
+    {'range': [670, 740], 'color': "lightgreen"},
+    {'range': [740, 850], 'color': "green"}
+]
+
+SCORE_GAUGE_STEPS = [
+    {'range': [300, 580], 'color': "lightgray"},
+    {'range': [580, 670], 'color': "yellow"},
+    {'range': [670, 740], 'color': "lightgreen"},
+    {'range': [740, 850], 'color': "green"}
+]
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def build_ml_score_gauge(score):
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number+delta",
+        value = score,
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': "ML Credit Score"},
+        delta = {'reference': 650, 'increasing': {'color': "green"}, 'decreasing': {'color': "red"}},
+        gauge = {
+            'axis': {'range': [300, 850]},
+            'bar': {'color': "darkblue"},
+            'steps': ML_GAUGE_STEPS,
+            'threshold': {
+                'line': {'color': "black", 'width': 4},
+                'thickness': 0.75,
+                'value': score
+            }
+        }
+    ))
+    fig.update_layout(height=350)
+    return fig
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def build_score_gauge(score):
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = score,
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': "Credit Score"},
+        gauge = {
+            'axis': {'range': [300, 850]},
+            'bar': {'color': "darkblue"},
+            'steps': SCORE_GAUGE_STEPS,
+            'threshold': {
+                'line': {'color': "red", 'width': 4},
+                'thickness': 0.75,
+                'value': 700
+            }
+        }
+    ))
+    fig.update_layout(height=300)
+    return fig
+
+# Bank statement charts, cached per income/expense pair like the gauges
+@st.cache_resource(max_entries=256, show_spinner=False)
+def build_financial_overview(monthly_income, monthly_expenses):
+    income_expense_data = pd.DataFrame({
+        'Category': ['Income', 'Expenses', 'Net Savings'],
+        'Amount': [monthly_income, monthly_expenses, monthly_income - monthly_expenses]
+    })
+    return px.bar(
+        income_expense_data, 
+        x='Category', 
+        y='Amount',
+        title="Monthly Financial Overview",
+        color='Category',
+        color_discrete_map={
+            'Income': 'green', 
+            'Expenses': 'red',
+            'Net Savings': 'blue'
+        }
+    )
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def build_income_allocation(monthly_expenses, savings):
+    pie_data = pd.DataFrame({
+        'Category': ['Expenses', 'Savings'],
+        'Amount': [monthly_expenses, savings]
+    })
+    return px.pie(
+        pie_data, 
+        values='Amount', 
+        names='Category',
+        title="Income Allocation",
+        color_discrete_map={'Expenses': 'red', 'Savings': 'green'}
+    )
+
+# Feature impact table for an ML prediction, one row per feature, largest impact first
+@st.cache_data(max_entries=256, show_spinner=False)
+def feature_impact_table(feature_importance):
+    importance_df = pd.DataFrame.from_dict(feature_importance, orient='index')
+    importance_df = importance_df.rename(columns={'value': 'Value', 'coefficient': 'Coefficient', 'impact': 'Impact'})
+    importance_df.insert(0, 'Feature', importance_df.index.str.replace('_', ' ', regex=False).str.title())
+    importance_df['Effect'] = np.where(importance_df['Coefficient'] > 0, 'Positive', 'Negative')
+    importance_df = importance_df.reset_index(drop=True)
+    return importance_df.iloc[np.argsort(-importance_df['Impact'].abs().to_numpy(), kind='stable')]
+
+# Feature impact bar for an ML prediction, cached on its top rows
+@st.cache_resource(max_entries=256, show_spinner=False)
+def build_feature_impact_chart(importance_df):
+    fig = px.bar(
+        importance_df, 
+        x='Impact', 
+        y='Feature',
+        orientation='h',
+        title="Top Feature Impacts on Credit Score",
+        color='Effect',
+        color_discrete_map={'Positive': 'green', 'Negative': 'red'}
+    )
+    fig.update_layout(height=400)
+    return fig
+
+# The model and batch charts only change when the model is retrained (which
+# clears them) or, for the batch charts, when the data does
+@st.cache_resource(show_spinner=False)
+def build_model_importance_chart():
+    importance_df = pd.DataFrame(credit_model.get_model_insights()['feature_insights'][:10])
+    fig = px.bar(
+        importance_df, 
+        x='importance', 
+        y='feature',
+        orientation='h',
+        title="Model Feature Importance (Top 10)",
+        color='effect',
+        color_discrete_map={'Positive': 'green', 'Negative': 'red'}
+    )
+    fig.update_layout(height=500)
+    return fig
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_batch_charts(db_mtime):
+    results_df = score_all_customers(db_mtime)
+    fig_dist = binned_histogram(
+        results_df['ML Credit Score'],
+        title="Credit Score Distribution (All Customers)",
+        x_label='Credit Score',
+        bin_range=SCORE_RANGE
+    )
+    risk_counts = results_df['Risk Level'].value_counts()
+    fig_risk = px.pie(
+        values=risk_counts.values, 
+        names=risk_counts.index,
+        title="Risk Level Distribution"
+    )
+    return fig_dist, fig_risk
+
+# Keyed on the database modification time, so the histogram is only rebinned
+# when new scores are written
+@st.cache_resource(max_entries=4, show_spinner=False)
+def build_score_history_chart(db_mtime):
+    return histogram_bars(
+        load_score_bins(db_mtime),
+        np.linspace(*SCORE_RANGE, SCORE_BINS + 1),
+        title="Historical Credit Score Distribution",
+        x_label='Credit Score'
+    )
+
+# Only this column reruns when the scoring button is clicked, so the customer
+# list, bank statement charts and score history below are not rebuilt
+@st.fragment
+def ml_scoring(customer_id, customer_data):
+    st.subheader("Advanced Credit Scoring")
+    
+    # Generate new credit score using logistic regression
+    if st.button("🔄 Generate ML Credit Score", type="primary"):
+        with st.spinner("Running logistic regression model..."):
+            # Predict credit score using ML model
+            prediction_result = predict_customer(customer_id, db.last_modified())
+            
+            # Store the new score in session state
+            st.session_state.ml_prediction = prediction_result
+    
+    # Display ML prediction results
+    if 'ml_prediction' in st.session_state:
+        prediction = st.session_state.ml_prediction
+        
+        col2a, col2b = st.columns(2)
+        with col2a:
+            st.metric("ML Credit Score", prediction['credit_score'])
+            st.metric("Risk Level", prediction['risk_level'])
+        
+        with col2b:
+            st.metric("Good Credit Probability", f"{prediction['good_credit_probability']:.1%}")
+            
+            # Risk color coding
+            risk_color = {
+                'Low Risk': 'green',
+                'Medium-Low Risk': 'lightgreen', 
+                'Medium Risk': 'orange',
+                'High Risk': 'red'
+            }
+            st.markdown(f"<div style='padding: 10px; background-color: {risk_color.get(prediction['risk_level'], 'gray')}; border-radius: 5px; text-align: center; color: white; font-weight: bold;'>{prediction['risk_level']}</div>", unsafe_allow_html=True)
+        
+        # Advanced score gauge
+        fig_gauge = build_ml_score_gauge(prediction['credit_score'])
+        st.plotly_chart(fig_gauge, use_container_width=True, key=f"ml-gauge-{prediction['credit_score']}")
+        
+        # Feature importance analysis
+        st.subheader("🔍 Feature Impact Analysis")
+        
+        importance_df = feature_impact_table(prediction['feature_importance'])
+        
+        # Feature importance chart
+        fig_importance = build_feature_impact_chart(importance_df.head(8))
+        st.plotly_chart(fig_importance, use_container_width=True, key="feature-impact")
+        
+        # Feature details table
+        st.subheader("📊 Detailed Feature Analysis")
+        display_df = importance_df[['Feature', 'Value', 'Impact', 'Effect']].round(3)
+        st.dataframe(display_df, use_container_width=True)
+    
+    else:
+        # Show existing credit score if available
+        if customer_data['credit_score']:
+            score = customer_data['credit_score']['score']
+            st.metric("Current Score", score)
+            
+            # Score gauge
+            fig_gauge = build_score_gauge(score)
+            st.plotly_chart(fig_gauge, use_container_width=True, key=f"score-gauge-{score}")
+        else:
+            st.info("Click 'Generate ML Credit Score' to assess this customer using our advanced logistic regression model")
+
 st.title("📈 Credit Scoring & Underwriting")
 st.markdown("AI-powered credit assessment with advanced logistic regression modeling")
 
 # Add tabs for different views
 tab1, tab2, tab3 = st.tabs(["Customer Assessment", "Model Insights", "Batch Scoring"])
 
-with tab1:
+# The customer assessment and batch scoring tabs run as fragments, so their
+# widgets rerun only their own tab
+@st.fragment
+def customer_assessment():
     # Customer selection
-    conn = db.connect()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, first_name, last_name, company_name, email FROM customers")
-    customers = cursor.fetchall()
-
-    customer_options = {}
-    for customer in customers:
-        name = customer[3] if customer[3] else f"{customer[1]} {customer[2]}"
-        customer_options[f"{name} ({customer[4]})"] = customer[0]
+    customer_options = load_customer_options(db.last_modified())
 
     selected_customer = st.selectbox("Select Customer:", list(customer_options.keys()))
     customer_id = customer_options[selected_customer]
 
     # Get customer data
-    customer_data = ai_assistant.get_customer_data(customer_id)
+    customer_data = load_customer_data(customer_id, db.last_modified())
 
     if customer_data:
         col1, col2 = st.columns(2)
@@ -71,141 +399,16 @@ with tab1:
         with col1:
             st.subheader("Customer Information")
             customer_info = customer_data['customer']
-            st.write(f"**Name:** {customer_info.get('first_name', '')} {customer_info.get('last_name', '')}")
-            if customer_info.get('company_name'):
-                st.write(f"**Company:** {customer_info['company_name']}")
-            st.write(f"**Email:** {customer_info['email']}")
-            st.write(f"**Type:** {customer_info['customer_type'].title()}")
-            st.write(f"**Country:** {customer_info['country']}")
+            # One markdown element for all four lines
+            st.markdown("  \n".join([
+                f"**{'Company' if customer_info['company_name'] else 'Name'}:** {customer_info['display_name']}",
+                f"**Email:** {customer_info['email']}",
+                f"**Type:** {customer_info['customer_type'].title()}",
+                f"**Country:** {customer_info['country']}"
+            ]))
         
         with col2:
-            st.subheader("Advanced Credit Scoring")
-            
-            # Generate new credit score using logistic regression
-            if st.button("🔄 Generate ML Credit Score", type="primary"):
-                with st.spinner("Running logistic regression model..."):
-                    # Predict credit score using ML model
-                    prediction_result = credit_model.predict_credit_score(customer_data)
-                    
-                    # Store the new score in session state
-                    st.session_state.ml_prediction = prediction_result
-            
-            # Display ML prediction results
-            if 'ml_prediction' in st.session_state:
-                prediction = st.session_state.ml_prediction
-                
-                col2a, col2b = st.columns(2)
-                with col2a:
-                    st.metric("ML Credit Score", prediction['credit_score'])
-                    st.metric("Risk Level", prediction['risk_level'])
-                
-                with col2b:
-                    st.metric("Good Credit Probability", f"{prediction['good_credit_probability']:.1%}")
-                    
-                    # Risk color coding
-                    risk_color = {
-                        'Low Risk': 'green',
-                        'Medium-Low Risk': 'lightgreen', 
-                        'Medium Risk': 'orange',
-                        'High Risk': 'red'
-                    }
-                    st.markdown(f"<div style='padding: 10px; background-color: {risk_color.get(prediction['risk_level'], 'gray')}; border-radius: 5px; text-align: center; color: white; font-weight: bold;'>{prediction['risk_level']}</div>", unsafe_allow_html=True)
-                
-                # Advanced score gauge
-                fig_gauge = go.Figure(go.Indicator(
-                    mode = "gauge+number+delta",
-                    value = prediction['credit_score'],
-                    domain = {'x': [0, 1], 'y': [0, 1]},
-                    title = {'text': "ML Credit Score"},
-                    delta = {'reference': 650, 'increasing': {'color': "green"}, 'decreasing': {'color': "red"}},
-                    gauge = {
-                        'axis': {'range': [300, 850]},
-                        'bar': {'color': "darkblue"},
-                        'steps': [
-                            {'range': [300, 580], 'color': "red"},
-                            {'range': [580, 670], 'color': "orange"},
-                            {'range': [670, 740], 'color': "lightgreen"},
-                            {'range': [740, 850], 'color': "green"}
-                        ],
-                        'threshold': {
-                            'line': {'color': "black", 'width': 4},
-                            'thickness': 0.75,
-                            'value': prediction['credit_score']
-                        }
-                    }
-                ))
-                fig_gauge.update_layout(height=350)
-                st.plotly_chart(fig_gauge, use_container_width=True)
-                
-                # Feature importance analysis
-                st.subheader("🔍 Feature Impact Analysis")
-                
-                feature_importance = prediction['feature_importance']
-                
-                # Create feature importance dataframe
-                importance_data = []
-                for feature, data in feature_importance.items():
-                    importance_data.append({
-                        'Feature': feature.replace('_', ' ').title(),
-                        'Value': data['value'],
-                        'Coefficient': data['coefficient'],
-                        'Impact': data['impact'],
-                        'Effect': 'Positive' if data['coefficient'] > 0 else 'Negative'
-                    })
-                
-                importance_df = pd.DataFrame(importance_data)
-                importance_df = importance_df.sort_values('Impact', key=abs, ascending=False)
-                
-                # Feature importance chart
-                fig_importance = px.bar(
-                    importance_df.head(8), 
-                    x='Impact', 
-                    y='Feature',
-                    orientation='h',
-                    title="Top Feature Impacts on Credit Score",
-                    color='Effect',
-                    color_discrete_map={'Positive': 'green', 'Negative': 'red'}
-                )
-                fig_importance.update_layout(height=400)
-                st.plotly_chart(fig_importance, use_container_width=True)
-                
-                # Feature details table
-                st.subheader("📊 Detailed Feature Analysis")
-                display_df = importance_df[['Feature', 'Value', 'Impact', 'Effect']].round(3)
-                st.dataframe(display_df, use_container_width=True)
-            
-            else:
-                # Show existing credit score if available
-                if customer_data['credit_score']:
-                    score = customer_data['credit_score']['score']
-                    st.metric("Current Score", score)
-                    
-                    # Score gauge
-                    fig_gauge = go.Figure(go.Indicator(
-                        mode = "gauge+number",
-                        value = score,
-                        domain = {'x': [0, 1], 'y': [0, 1]},
-                        title = {'text': "Credit Score"},
-                        gauge = {
-                            'axis': {'range': [300, 850]},
-                            'bar': {'color': "darkblue"},
-                            'steps': [
-                                {'range': [300, 580], 'color': "lightgray"},
-                                {'range': [580, 670], 'color': "yellow"},
-                                {'range': [670, 740], 'color': "lightgreen"},
-                                {'range': [740, 850], 'color': "green"}
-                            ],
-                            'threshold': {
-                                'line': {'color': "red", 'width': 4},
-                                'thickness': 0.75,
-                                'value': 700
-                            }
-                        }
-                    ))
-                    fig_gauge.update_layout(height=300)
-                    st.plotly_chart(fig_gauge, use_container_width=True)
-                else:
-                    st.info("Click 'Generate ML Credit Score' to assess this customer using our advanced logistic regression model")
+            ml_scoring(customer_id, customer_data)
 
         # Bank statement analysis
         st.markdown("---")
@@ -215,11 +418,11 @@ with tab1:
             
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Monthly Income", f"€{bank_data['monthly_income']:,.2f}")
+                st.metric("Monthly Income", format_eur(bank_data['monthly_income']))
             with col2:
-                st.metric("Monthly Expenses", f"€{bank_data['monthly_expenses']:,.2f}")
+                st.metric("Monthly Expenses", format_eur(bank_data['monthly_expenses']))
             with col3:
-                st.metric("Current Balance", f"€{bank_data['balance']:,.2f}")
+                st.metric("Current Balance", format_eur(bank_data['balance']))
             with col4:
                 # Calculate and display debt-to-income ratio
                 if bank_data['monthly_income'] > 0:
@@ -233,73 +436,43 @@ with tab1:
             
             with col1:
                 # Income vs Expenses
-                income_expense_data = pd.DataFrame({
-                    'Category': ['Income', 'Expenses', 'Net Savings'],
-                    'Amount': [
-                        bank_data['monthly_income'], 
-                        bank_data['monthly_expenses'],
-                        bank_data['monthly_income'] - bank_data['monthly_expenses']
-                    ]
-                })
-                
-                fig_bar = px.bar(
-                    income_expense_data, 
-                    x='Category', 
-                    y='Amount',
-                    title="Monthly Financial Overview",
-                    color='Category',
-                    color_discrete_map={
-                        'Income': 'green', 
-                        'Expenses': 'red',
-                        'Net Savings': 'blue'
-                    }
-                )
-                st.plotly_chart(fig_bar, use_container_width=True)
+                fig_bar = build_financial_overview(bank_data['monthly_income'], bank_data['monthly_expenses'])
+                st.plotly_chart(fig_bar, use_container_width=True, key=f"financial-overview-{customer_id}")
             
             with col2:
                 # Financial health pie chart
                 if bank_data['monthly_income'] > 0:
                     savings = bank_data['monthly_income'] - bank_data['monthly_expenses']
                     if savings > 0:
-                        pie_data = pd.DataFrame({
-                            'Category': ['Expenses', 'Savings'],
-                            'Amount': [bank_data['monthly_expenses'], savings]
-                        })
-                        
-                        fig_pie = px.pie(
-                            pie_data, 
-                            values='Amount', 
-                            names='Category',
-                            title="Income Allocation",
-                            color_discrete_map={'Expenses': 'red', 'Savings': 'green'}
-                        )
-                        st.plotly_chart(fig_pie, use_container_width=True)
+                        fig_pie = build_income_allocation(bank_data['monthly_expenses'], savings)
+                        st.plotly_chart(fig_pie, use_container_width=True, key=f"income-allocation-{customer_id}")
             
             # Risk indicators
-            if bank_data['risk_indicators']:
-                risk_data = json.loads(bank_data['risk_indicators']) if isinstance(bank_data['risk_indicators'], str) else bank_data['risk_indicators']
+            if isinstance(bank_data['risk_indicators'], dict):
+                risk_data = bank_data['risk_indicators']
                 
                 st.subheader("⚠️ Risk Indicators")
                 
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("Overdrafts", risk_data.get('overdrafts', 0))
-                with col2:
-                    st.metric("Returned Payments", risk_data.get('returned_payments', 0))
-                with col3:
-                    gambling = "Yes" if risk_data.get('gambling_transactions') else "No"
-                    st.metric("Gambling Transactions", gambling)
-                with col4:
-                    irregular = "Yes" if risk_data.get('irregular_income') else "No"
-                    st.metric("Irregular Income", irregular)
+                # All four indicators in one table element
+                risk_df = pd.DataFrame({
+                    'Indicator': ['Overdrafts', 'Returned Payments', 'Gambling Transactions', 'Irregular Income'],
+                    'Value': [
+                        str(risk_data.get('overdrafts', 0)),
+                        str(risk_data.get('returned_payments', 0)),
+                        "Yes" if risk_data.get('gambling_transactions') else "No",
+                        "Yes" if risk_data.get('irregular_income') else "No"
+                    ]
+                })
+                st.dataframe(risk_df, hide_index=True)
                 
                 # Risk score calculation
-                risk_score = (
-                    risk_data.get('overdrafts', 0) * 2 +
-                    risk_data.get('returned_payments', 0) * 3 +
-                    (5 if risk_data.get('gambling_transactions') else 0) +
-                    (3 if risk_data.get('irregular_income') else 0)
-                )
+                risk_values = np.array([
+                    risk_data.get('overdrafts', 0),
+                    risk_data.get('returned_payments', 0),
+                    bool(risk_data.get('gambling_transactions')),
+                    bool(risk_data.get('irregular_income'))
+                ], dtype=int)
+                risk_score = int(RISK_WEIGHTS @ risk_values)
                 
                 if risk_score <= 5:
                     st.success(f"✅ Low Risk Score: {risk_score}")
@@ -310,6 +483,9 @@ with tab1:
         else:
             st.info("No bank statement data available for this customer")
 
+with tab1:
+    customer_assessment()
+
 with tab2:
     st.subheader("🧠 Machine Learning Model Insights")
     
@@ -330,19 +506,8 @@ with tab2:
         # Create feature importance chart
         feature_insights = model_insights['feature_insights'][:10]  # Top 10 features
         
-        importance_df = pd.DataFrame(feature_insights)
-        
-        fig_model_importance = px.bar(
-            importance_df, 
-            x='importance', 
-            y='feature',
-            orientation='h',
-            title="Model Feature Importance (Top 10)",
-            color='effect',
-            color_discrete_map={'Positive': 'green', 'Negative': 'red'}
-        )
-        fig_model_importance.update_layout(height=500)
-        st.plotly_chart(fig_model_importance, use_container_width=True)
+        fig_model_importance = build_model_importance_chart()
+        st.plotly_chart(fig_model_importance, use_container_width=True, key="model-importance")
         
         # Feature details
         st.subheader("🔍 Feature Details")
@@ -369,45 +534,22 @@ with tab2:
         Higher probability = Higher credit score.
         """)
 
-with tab3:
+@st.fragment
+def batch_scoring():
     st.subheader("📊 Batch Credit Scoring")
     
-    # Get all customers for batch processing
-    cursor.execute("SELECT id, first_name, last_name, company_name, email FROM customers")
-    all_customers = cursor.fetchall()
-    
     if st.button("🚀 Score All Customers", type="primary"):
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        batch_results = []
-        
-        for i, customer in enumerate(all_customers):
-            customer_id = customer[0]
-            name = customer[3] if customer[3] else f"{customer[1]} {customer[2]}"
-            
-            status_text.text(f"Scoring customer: {name}")
-            
-            # Get customer data and predict
-            customer_data = ai_assistant.get_customer_data(customer_id)
-            if customer_data:
-                prediction = credit_model.predict_credit_score(customer_data)
-                
-                batch_results.append({
-                    'Customer': name,
-                    'Email': customer[4],
-                    'ML Credit Score': prediction['credit_score'],
-                    'Risk Level': prediction['risk_level'],
-                    'Good Credit Probability': f"{prediction['good_credit_probability']:.1%}"
-                })
-            
-            progress_bar.progress((i + 1) / len(all_customers))
-        
-        status_text.text("Batch scoring complete!")
+        st.session_state.batch_scored_mtime = db.last_modified()
+    
+    # The results stay up across reruns, e.g. after a download, until the next
+    # scoring run; they and their charts are cached on the scored data version
+    if 'batch_scored_mtime' in st.session_state:
+        scored_mtime = st.session_state.batch_scored_mtime
+        with st.spinner("Scoring all customers..."):
+            results_df = score_all_customers(scored_mtime)
         
         # Display results
-        if batch_results:
-            results_df = pd.DataFrame(batch_results)
+        if not results_df.empty:
             
             # Summary statistics
             col1, col2, col3, col4 = st.columns(4)
@@ -424,24 +566,10 @@ with tab3:
                 total_customers = len(results_df)
                 st.metric("Total Scored", total_customers)
             
-            # Score distribution
-            fig_dist = px.histogram(
-                results_df, 
-                x='ML Credit Score', 
-                nbins=20,
-                title="Credit Score Distribution (All Customers)",
-                labels={'ML Credit Score': 'Credit Score', 'count': 'Number of Customers'}
-            )
-            st.plotly_chart(fig_dist, use_container_width=True)
-            
-            # Risk level distribution
-            risk_counts = results_df['Risk Level'].value_counts()
-            fig_risk = px.pie(
-                values=risk_counts.values, 
-                names=risk_counts.index,
-                title="Risk Level Distribution"
-            )
-            st.plotly_chart(fig_risk, use_container_width=True)
+            # Score and risk level distributions
+            fig_dist, fig_risk = build_batch_charts(scored_mtime)
+            st.plotly_chart(fig_dist, use_container_width=True, key="batch-distribution")
+            st.plotly_chart(fig_risk, use_container_width=True, key="batch-risk")
             
             # Results table
             st.subheader("📋 Detailed Results")
@@ -456,41 +584,33 @@ with tab3:
                 mime="text/csv"
             )
 
+with tab3:
+    batch_scoring()
+
 # Credit scoring overview (existing customers)
 st.markdown("---")
 st.subheader("📈 Historical Credit Scores")
 
-cursor.execute("""
-    SELECT c.first_name, c.last_name, c.company_name, cs.score, cs.score_date
-    FROM credit_scores cs
-    JOIN customers c ON cs.customer_id = c.id
-    ORDER BY cs.score_date DESC
-""")
-all_scores = cursor.fetchall()
-
-if all_scores:
-    df_scores = pd.DataFrame(all_scores, columns=[
-        'First Name', 'Last Name', 'Company', 'Score', 'Date'
-    ])
-    df_scores['Customer'] = df_scores.apply(
-        lambda x: x['Company'] if pd.notna(x['Company']) else f"{x['First Name']} {x['Last Name']}", axis=1
-    )
+# Off by default, so a page load doesn't query or chart the score history
+# until it is asked for
+show_history = st.toggle("Show score history", value=False)
+total_scores = int(load_score_bins(db.last_modified()).sum()) if show_history else 0
+
+if total_scores:
     
     # Score distribution chart
-    fig_hist = px.histogram(
-        df_scores, 
-        x='Score', 
-        nbins=20,
-        title="Historical Credit Score Distribution",
-        labels={'Score': 'Credit Score', 'count': 'Number of Customers'}
-    )
-    st.plotly_chart(fig_hist, use_container_width=True)
+    fig_hist = build_score_history_chart(db.last_modified())
+    st.plotly_chart(fig_hist, use_container_width=True, key="score-history")
     
-    # Scores table
+    # Scores table, one page at a time
+    page_count = max(1, math.ceil(total_scores / SCORES_PAGE_SIZE))
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+    df_scores = load_score_page(int(page), db.last_modified())
     display_df = df_scores[['Customer', 'Score', 'Date']]
     st.dataframe(display_df, use_container_width=True)
+elif show_history:
+    st.info("No credit scores recorded yet.")
 
-db.close()
 
 # Sidebar information
 with st.sidebar:
@@ -535,6 +655,10 @@ with st.sidebar:
     if st.button("Retrain Model"):
         with st.spinner("Retraining model..."):
             credit_model.train_model(retrain=True)
+            predict_customer.clear()
+            score_all_customers.clear()
+            build_model_importance_chart.clear()
+            build_batch_charts.clear()
             st.success("Model retrained successfully!")
-            st.experimental_rerun()
+            st.rerun()
 
@@ -1,8 +1,5 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-import json
-import sqlite3
 from datetime import datetime
 import os
 import sys
@@ -27,7 +24,10 @@ def init_ai_assistant():
 
 @st.cache_resource
 def init_database():
-    return LendingDatabase()
+    # Connected once; the connection is reused across reruns and sessions
+    db = LendingDatabase()
+    db.connect()
+    return db
 
 @st.cache_resource
 def init_prompt_generator():
@@ -106,9 +106,7 @@ with tab1:
             col1, col2 = st.columns([1, 1])
             with col1:
                 if st.button("Save to Campaign Database"):
-                    conn = db.connect()
-                    cursor = conn.cursor()
-                    cursor.execute("""
+                    db.execute_write("""
                         INSERT INTO marketing_campaigns 
                         (campaign_name, target_audience, channel, content, ai_generated_content, start_date, status)
                         VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -121,8 +119,6 @@ with tab1:
                         datetime.now().date(),
                         "draft"
                     ))
-                    conn.commit()
-                    db.close()
                     st.success("Campaign saved to database!")
             
             with col2:
@@ -133,32 +129,33 @@ with tab1:
     st.markdown("---")
     st.subheader("Campaign Management")
 
-    conn = db.connect()
-    cursor = conn.cursor()
-
     # Campaign statistics
-    cursor.execute("SELECT status, COUNT(*) FROM marketing_campaigns GROUP BY status")
-    status_data = cursor.fetchall()
+    total_campaigns, active, draft, completed = db.query_one("""
+        SELECT COUNT(*),
+               COALESCE(SUM(status = 'active'), 0),
+               COALESCE(SUM(status = 'draft'), 0),
+               COALESCE(SUM(status = 'completed'), 0)
+        FROM marketing_campaigns
+    """)
 
-    if status_data:
+    if total_campaigns:
         col1, col2, col3, col4 = st.columns(4)
-        status_dict = dict(status_data)
         
         with col1:
-            st.metric("Total Campaigns", sum(status_dict.values()))
+            st.metric("Total Campaigns", total_campaigns)
         with col2:
-            st.metric("Active", status_dict.get('active', 0))
+            st.metric("Active", active)
         with col3:
-            st.metric("Draft", status_dict.get('draft', 0))
+            st.metric("Draft", draft)
         with col4:
-            st.metric("Completed", status_dict.get('completed', 0))
+            st.metric("Completed", completed)
 
     # Campaign performance chart
-    cursor.execute("SELECT channel, COUNT(*) as count FROM marketing_campaigns GROUP BY channel")
-    channel_data = cursor.fetchall()
+    df_channels = db.query_df(
+        'SELECT channel AS "Channel", COUNT(*) AS "Count" FROM marketing_campaigns GROUP BY channel'
+    )
 
-    if channel_data:
-        df_channels = pd.DataFrame(channel_data, columns=['Channel', 'Count'])
+    if not df_channels.empty:
         fig_pie = px.pie(
             df_channels, 
             values='Count', 
@@ -169,17 +166,15 @@ with tab1:
 
     # Display existing campaigns
     st.subheader("Existing Marketing Campaigns")
-    cursor.execute("""
-        SELECT campaign_name, target_audience, channel, status, start_date, budget, created_at
+    campaigns_df = db.query_df("""
+        SELECT campaign_name AS "Campaign", target_audience AS "Audience", channel AS "Channel",
+               status AS "Status", start_date AS "Start Date", budget AS "Budget", created_at AS "Created"
         FROM marketing_campaigns 
         ORDER BY created_at DESC
-    """)
-    campaigns = cursor.fetchall()
+    """, dtype={'Audience': 'category', 'Channel': 'category', 'Status': 'category'},
+        parse_dates=['Start Date', 'Created'])
 
-    if campaigns:
-        campaigns_df = pd.DataFrame(campaigns, columns=[
-            'Campaign', 'Audience', 'Channel', 'Status', 'Start Date', 'Budget', 'Created'
-        ])
+    if not campaigns_df.empty:
         
         # Add filters
         col1, col2, col3 = st.columns(3)
@@ -219,12 +214,11 @@ with tab1:
             )
             
             if selected_campaign:
-                cursor.execute("""
+                content_result = db.query_one("""
                     SELECT ai_generated_content 
                     FROM marketing_campaigns 
                     WHERE campaign_name = ?
                 """, (selected_campaign,))
-                content_result = cursor.fetchone()
                 
                 if content_result and content_result[0]:
                     st.subheader(f"Content for: {selected_campaign}")
@@ -232,8 +226,6 @@ with tab1:
     else:
         st.info("No campaigns found. Generate your first campaign above!")
 
-    db.close()
-
 with tab2:
     st.markdown("### 🎯 AI-Powered Prompt Generator")
     st.markdown("Create and enhance marketing prompts using AI assistance and pre-built templates.")
@@ -446,9 +438,7 @@ with tab2:
                         
                         # Save option
                         if st.button("💾 Save to Campaign Database"):
-                            conn = db.connect()
-                            cursor = conn.cursor()
-                            cursor.execute("""
+                            db.execute_write("""
                                 INSERT INTO marketing_campaigns 
                                 (campaign_name, target_audience, channel, content, ai_generated_content, start_date, status)
                                 VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -461,8 +451,6 @@ with tab2:
                                 datetime.now().date(),
                                 "draft"
                             ))
-                            conn.commit()
-                            db.close()
                             st.success("Content saved to campaign database!")
                     else:
                         st.error(f"Error: {result.get('error')}")
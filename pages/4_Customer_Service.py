@@ -1,11 +1,10 @@
 import streamlit as st
-import pandas as pd
+import numpy as np
 import plotly.express as px
-import json
-import sqlite3
-from datetime import datetime
 import os
 import sys
+import math
+from concurrent.futures import ThreadPoolExecutor
 
 # Add parent directory to path to import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -26,24 +25,76 @@ def init_ai_assistant():
 
 @st.cache_resource
 def init_database():
-    return LendingDatabase()
+    # Connected once; the connection is reused across reruns and sessions
+    db = LendingDatabase()
+    db.connect()
+    return db
 
 ai_assistant = init_ai_assistant()
 db = init_database()
 
+# Chat interactions are buffered per session and written in batches of this size,
+# or sooner on the next full rerun of the page
+SERVICE_FLUSH_SIZE = 5
+
+# Rows per page of the recent interactions table
+INTERACTIONS_PAGE_SIZE = 10
+
+def flush_pending_interactions():
+    pending = st.session_state.get("pending_interactions")
+    if pending:
+        db.save_service_interactions(pending)
+        st.session_state.pending_interactions = []
+
+# Top-level code only runs on full reruns, never on chat fragment reruns, so
+# the queue is written as soon as the user does anything outside the chat
+flush_pending_interactions()
+
+# Keyed by the database modification time, so saving a chat interaction
+# invalidates the cached metrics on the same rerun
+@st.cache_data(ttl=30, show_spinner=False)
+def load_service_metrics(db_mtime):
+    return db.query_one("""
+        SELECT COUNT(*),
+               AVG(sentiment_score),
+               SUM(resolution_status = 'resolved'),
+               COUNT(DISTINCT customer_id)
+        FROM customer_service
+    """)
+
+@st.cache_data(ttl=15, show_spinner=False)
+def load_recent_interactions(page, db_mtime):
+    return db.query_df("""
+        SELECT COALESCE(c.company_name, c.first_name || ' ' || c.last_name) AS "Customer",
+               cs.subject AS "Subject", cs.sentiment_score AS "Sentiment",
+               cs.resolution_status AS "Status", cs.created_at AS "Date"
+        FROM customer_service cs
+        JOIN customers c ON cs.customer_id = c.id
+        ORDER BY cs.created_at DESC
+        LIMIT ? OFFSET ?
+    """, params=(INTERACTIONS_PAGE_SIZE, (page - 1) * INTERACTIONS_PAGE_SIZE),
+        dtype={'Status': 'category'}, parse_dates=['Date'])
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_customers(db_mtime):
+    return db.query_df("""
+        SELECT id, name || ' (' || email || ')' AS label
+        FROM (
+            SELECT id, COALESCE(company_name, first_name || ' ' || last_name) AS name, email
+            FROM customers
+        )
+    """)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_customer_data(customer_id, db_mtime):
+    return ai_assistant.get_customer_data(customer_id)
+
 st.title("💬 AI Customer Service Chat")
 st.markdown("Intelligent customer support with context-aware responses")
 
 # Customer selection for context
-conn = db.connect()
-cursor = conn.cursor()
-cursor.execute("SELECT id, first_name, last_name, company_name, email FROM customers")
-customers = cursor.fetchall()
-
-customer_options = {"No specific customer": None}
-for customer in customers:
-    name = customer[3] if customer[3] else f"{customer[1]} {customer[2]}"
-    customer_options[f"{name} ({customer[4]})"] = customer[0]
+customers_df = load_customers(db.last_modified())
+customer_options = {"No specific customer": None, **dict(zip(customers_df['label'], customers_df['id'].tolist()))}
 
 col1, col2 = st.columns([2, 1])
 
@@ -57,104 +108,99 @@ with col2:
     else:
         st.info("ℹ️ General support mode")
 
-# Initialize chat history
-if "service_chat_history" not in st.session_state:
-    st.session_state.service_chat_history = []
-
-# Chat interface
-st.subheader("Customer Support Chat")
-
-# Display chat history
-for message in st.session_state.service_chat_history:
-    with st.chat_message(message["role"]):
-        st.write(message["content"])
-        if "sentiment" in message:
-            if message["sentiment"] < -0.5:
-                st.error("⚠️ Negative sentiment detected")
-            elif message["sentiment"] > 0.5:
-                st.success("😊 Positive sentiment")
-
-# Chat input
-if prompt := st.chat_input("How can I help you today?"):
-    # Add user message to chat history
-    st.session_state.service_chat_history.append({"role": "user", "content": prompt})
+# The chat and its controls rerun as a fragment, so sending a message doesn't
+# rebuild the analytics below; they pick up flushed interactions on the next full rerun
+@st.fragment
+def service_chat(customer_id):
+    # Initialize chat history
+    if "service_chat_history" not in st.session_state:
+        st.session_state.service_chat_history = []
     
-    with st.chat_message("user"):
-        st.write(prompt)
+    # Chat interface
+    st.subheader("Customer Support Chat")
     
-    # Get customer context if selected
-    customer_context = None
-    if customer_id:
-        customer_context = ai_assistant.get_customer_data(customer_id)
+    # Chat input; the new message joins the history before it is rendered, so
+    # every turn is drawn once by the loop below
+    prompt = st.chat_input("How can I help you today?")
+    if prompt:
+        st.session_state.service_chat_history.append({"role": "user", "content": prompt})
+    
+    # Display chat history
+    for message in st.session_state.service_chat_history:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
+            if "sentiment" in message:
+                if message["sentiment"] < -0.5:
+                    st.error("⚠️ Negative sentiment detected")
+                elif message["sentiment"] > 0.5:
+                    st.success("😊 Positive sentiment")
     
-    # Get AI response
-    with st.chat_message("assistant"):
-        with st.spinner("Processing your request..."):
-            response = ai_assistant.customer_service_chat(prompt, customer_context)
-            st.write(response)
+    if prompt:
+        # Get customer context if selected
+        customer_context = None
+        if customer_id:
+            customer_context = load_customer_data(customer_id, db.last_modified())
+        
+        # Get AI response
+        with st.chat_message("assistant"):
+            # Sentiment is scored in the background while the reply streams in
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                sentiment_future = executor.submit(ai_assistant.analyze_sentiment, prompt)
+                response = st.write_stream(ai_assistant.customer_service_chat_stream(prompt, customer_context))
+                sentiment = sentiment_future.result()
             
-            # Analyze sentiment
-            sentiment = ai_assistant.analyze_sentiment(prompt)
             if sentiment['score'] < -0.5:
                 st.warning("⚠️ Negative sentiment detected. Consider escalating to human agent.")
                 st.write(f"Sentiment analysis: {sentiment['explanation']}")
+        
+        # Add assistant response to chat history with sentiment
+        st.session_state.service_chat_history.append({
+            "role": "assistant", 
+            "content": response,
+            "sentiment": sentiment['score']
+        })
+        
+        # Queue interaction for the database
+        if customer_id:
+            st.session_state.setdefault("pending_interactions", []).append((
+                customer_id,
+                "chat",
+                "General Inquiry",
+                prompt,
+                response,
+                sentiment['score'],
+                "resolved"
+            ))
+            if len(st.session_state.pending_interactions) >= SERVICE_FLUSH_SIZE:
+                flush_pending_interactions()
     
-    # Add assistant response to chat history with sentiment
-    st.session_state.service_chat_history.append({
-        "role": "assistant", 
-        "content": response,
-        "sentiment": sentiment['score']
-    })
+    # Chat controls
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("Clear Chat History"):
+            flush_pending_interactions()
+            st.session_state.service_chat_history = []
+            st.rerun()
     
-    # Save interaction to database
-    if customer_id:
-        cursor.execute("""
-            INSERT INTO customer_service 
-            (customer_id, interaction_type, subject, message, ai_response, sentiment_score, resolution_status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            customer_id,
-            "chat",
-            "General Inquiry",
-            prompt,
-            response,
-            sentiment['score'],
-            "resolved"
-        ))
-        conn.commit()
-
-# Chat controls
-col1, col2, col3 = st.columns(3)
-with col1:
-    if st.button("Clear Chat History"):
-        st.session_state.service_chat_history = []
-        st.rerun()
+    with col2:
+        if st.button("Escalate to Human Agent"):
+            st.warning("🔄 Escalating to human agent...")
+            st.info("A human agent will be with you shortly.")
+    
+    with col3:
+        if st.button("End Conversation"):
+            flush_pending_interactions()
+            st.success("✅ Conversation ended. Thank you for contacting us!")
 
-with col2:
-    if st.button("Escalate to Human Agent"):
-        st.warning("🔄 Escalating to human agent...")
-        st.info("A human agent will be with you shortly.")
-
-with col3:
-    if st.button("End Conversation"):
-        st.success("✅ Conversation ended. Thank you for contacting us!")
+service_chat(customer_id)
 
 # Customer service analytics
 st.markdown("---")
 st.subheader("Customer Service Analytics")
 
-# Service metrics
-cursor.execute("SELECT COUNT(*) FROM customer_service")
-total_interactions = cursor.fetchone()[0]
-
-cursor.execute("SELECT AVG(sentiment_score) FROM customer_service WHERE sentiment_score IS NOT NULL")
-avg_sentiment = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(*) FROM customer_service WHERE resolution_status = 'resolved'")
-resolved_count = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(DISTINCT customer_id) FROM customer_service")
-unique_customers = cursor.fetchone()[0]
+# Service metrics in a single query
+total_interactions, avg_sentiment, resolved_count, unique_customers = load_service_metrics(db.last_modified())
+resolved_count = resolved_count or 0
 
 col1, col2, col3, col4 = st.columns(4)
 with col1:
@@ -168,22 +214,20 @@ with col4:
     st.metric("Unique Customers", unique_customers)
 
 # Sentiment analysis chart
-cursor.execute("""
+df_sentiment = db.query_df("""
     SELECT 
         CASE 
             WHEN sentiment_score >= 0.5 THEN 'Positive'
             WHEN sentiment_score <= -0.5 THEN 'Negative'
             ELSE 'Neutral'
-        END as sentiment_category,
-        COUNT(*) as count
+        END AS "Sentiment",
+        COUNT(*) AS "Count"
     FROM customer_service 
     WHERE sentiment_score IS NOT NULL
-    GROUP BY sentiment_category
+    GROUP BY 1
 """)
-sentiment_data = cursor.fetchall()
 
-if sentiment_data:
-    df_sentiment = pd.DataFrame(sentiment_data, columns=['Sentiment', 'Count'])
+if not df_sentiment.empty:
     fig_sentiment = px.pie(
         df_sentiment, 
         values='Count', 
@@ -199,35 +243,22 @@ if sentiment_data:
 
 # Recent interactions table
 st.subheader("Recent Customer Service Interactions")
-cursor.execute("""
-    SELECT c.first_name, c.last_name, c.company_name, cs.subject, 
-           cs.sentiment_score, cs.resolution_status, cs.created_at
-    FROM customer_service cs
-    JOIN customers c ON cs.customer_id = c.id
-    ORDER BY cs.created_at DESC
-    LIMIT 10
-""")
-interactions = cursor.fetchall()
-
-if interactions:
-    interactions_df = pd.DataFrame(interactions, columns=[
-        'First Name', 'Last Name', 'Company', 'Subject', 'Sentiment', 'Status', 'Date'
-    ])
-    interactions_df['Customer'] = interactions_df.apply(
-        lambda x: x['Company'] if pd.notna(x['Company']) else f"{x['First Name']} {x['Last Name']}", axis=1
-    )
+page_count = max(1, math.ceil(total_interactions / INTERACTIONS_PAGE_SIZE))
+page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+interactions_df = load_recent_interactions(int(page), db.last_modified())
+
+if not interactions_df.empty:
     
-    # Color code sentiment
-    def sentiment_color(val):
-        if val >= 0.5:
-            return 'background-color: lightgreen'
-        elif val <= -0.5:
-            return 'background-color: lightcoral'
-        else:
-            return 'background-color: lightyellow'
+    # Color code sentiment, the whole column picked with numpy
+    def sentiment_colors(sentiment):
+        return np.select(
+            [sentiment >= 0.5, sentiment <= -0.5],
+            ['background-color: lightgreen', 'background-color: lightcoral'],
+            default='background-color: lightyellow'
+        )
     
     display_df = interactions_df[['Customer', 'Subject', 'Sentiment', 'Status', 'Date']]
-    styled_df = display_df.style.applymap(sentiment_color, subset=['Sentiment'])
+    styled_df = display_df.style.apply(sentiment_colors, subset=['Sentiment'])
     st.dataframe(styled_df, use_container_width=True)
 
 # Common issues and responses
@@ -253,7 +284,6 @@ for issue, response in common_issues.items():
             })
             st.success("Response added to chat!")
 
-db.close()
 
 # Sidebar information
 with st.sidebar:
@@ -1,10 +1,7 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-import json
-import sqlite3
-from datetime import datetime, timedelta
 import os
 import sys
 
@@ -12,6 +9,7 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.ai_utils import AILendingAssistant
 from utils.database import LendingDatabase
+from utils.charts import risk_heatmap
 
 # Page configuration
 st.set_page_config(
@@ -27,7 +25,10 @@ def init_ai_assistant():
 
 @st.cache_resource
 def init_database():
-    return LendingDatabase()
+    # Connected once; the connection is reused across reruns and sessions
+    db = LendingDatabase()
+    db.connect()
+    return db
 
 ai_assistant = init_ai_assistant()
 db = init_database()
@@ -36,28 +37,19 @@ st.title("💰 AI Collections Management")
 st.markdown("Automated collection email generation and management")
 
 # Get collections data
-conn = db.connect()
-cursor = conn.cursor()
-cursor.execute("""
-    SELECT col.id, c.first_name, c.last_name, c.company_name, c.email,
-           col.outstanding_amount, col.days_overdue, col.collection_stage, col.loan_id
+collections_df = db.query_df("""
+    SELECT col.id AS "ID", COALESCE(c.company_name, c.first_name || ' ' || c.last_name) AS "Customer",
+           c.email AS "Email", col.outstanding_amount AS "Outstanding", col.days_overdue AS "Days Overdue",
+           col.collection_stage AS "Stage", col.loan_id AS "Loan ID"
     FROM collections col
     JOIN customers c ON col.customer_id = c.id
     ORDER BY col.days_overdue DESC
-""")
-collections = cursor.fetchall()
+""", dtype={'Stage': 'category'})
 
-if collections:
+if not collections_df.empty:
     # Collections overview
     st.subheader("Collections Overview")
     
-    collections_df = pd.DataFrame(collections, columns=[
-        'ID', 'First Name', 'Last Name', 'Company', 'Email', 'Outstanding', 'Days Overdue', 'Stage', 'Loan ID'
-    ])
-    collections_df['Customer'] = collections_df.apply(
-        lambda x: x['Company'] if pd.notna(x['Company']) else f"{x['First Name']} {x['Last Name']}", axis=1
-    )
-    
     # Summary metrics
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -96,7 +88,7 @@ if collections:
     
     with col2:
         # Outstanding amount by stage
-        stage_amounts = collections_df.groupby('Stage')['Outstanding'].sum()
+        stage_amounts = collections_df.groupby('Stage', observed=True)['Outstanding'].sum()
         fig_amounts = px.pie(
             values=stage_amounts.values,
             names=stage_amounts.index,
@@ -106,12 +98,10 @@ if collections:
     
     # Collections risk heatmap
     st.subheader("Collections Risk Heatmap")
-    fig_heatmap = px.density_heatmap(
-        collections_df, 
-        x='Days Overdue', 
-        y='Outstanding',
-        title="Risk Heatmap: Days Overdue vs Outstanding Amount",
-        labels={'Outstanding': 'Outstanding Amount (€)', 'Days Overdue': 'Days Overdue'}
+    fig_heatmap = risk_heatmap(
+        collections_df['Days Overdue'],
+        collections_df['Outstanding'],
+        title="Risk Heatmap: Days Overdue vs Outstanding Amount"
     )
     st.plotly_chart(fig_heatmap, use_container_width=True)
     
@@ -119,11 +109,29 @@ if collections:
     st.markdown("---")
     st.subheader("Generate Collection Email")
     
-    # Select customer for email generation
-    customer_options = {}
-    for _, row in collections_df.iterrows():
-        key = f"{row['Customer']} - €{row['Outstanding']:,.2f} ({row['Days Overdue']} days overdue)"
-        customer_options[key] = row['ID']
+    # Select customer for email generation. The selector and the details table are
+    # capped at the top N most overdue accounts so their size doesn't grow with the book.
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        search = st.text_input("Search customer or notes:", "")
+    with col2:
+        top_n = st.number_input("Show top N accounts:", min_value=10, value=50, step=10)
+    
+    accounts_df = collections_df
+    if search:
+        # Customer names are matched in pandas, notes and saved emails through the FTS index
+        note_matches = collections_df['ID'].isin(db.search_ids("collections_notes_fts", search))
+        accounts_df = collections_df[collections_df['Customer'].str.contains(search, case=False, regex=False) | note_matches]
+        if accounts_df.empty:
+            st.warning(f"No accounts match '{search}'; showing the most overdue accounts.")
+            accounts_df = collections_df
+    accounts_df = accounts_df.head(top_n)
+    
+    labels = (
+        accounts_df['Customer'] + ' - €' + accounts_df['Outstanding'].map('{:,.2f}'.format)
+        + ' (' + accounts_df['Days Overdue'].astype(str) + ' days overdue)'
+    )
+    customer_options = dict(zip(labels, accounts_df['ID'].tolist()))
     
     selected_collection = st.selectbox("Select Account:", list(customer_options.keys()))
     collection_id = customer_options[selected_collection]
@@ -188,12 +196,11 @@ if collections:
             col1, col2, col3 = st.columns(3)
             with col1:
                 if st.button("Save Email"):
-                    cursor.execute("""
+                    db.execute_write("""
                         UPDATE collections 
                         SET ai_generated_email = ?, updated_at = CURRENT_TIMESTAMP 
                         WHERE id = ?
                     """, (email_content, collection_id))
-                    conn.commit()
                     st.success("Email saved to database!")
             
             with col2:
@@ -293,28 +300,31 @@ if collections:
         (collections_df['Days Overdue'] >= min_days)
     ]
     
-    # Display filtered table
-    display_df = filtered_collections[['Customer', 'Loan ID', 'Outstanding', 'Days Overdue', 'Stage']].copy()
-    display_df['Outstanding'] = display_df['Outstanding'].apply(lambda x: f"€{x:,.2f}")
+    # Display filtered table, most overdue first
+    display_df = filtered_collections[['Customer', 'Loan ID', 'Outstanding', 'Days Overdue', 'Stage']].head(top_n)
+    if len(filtered_collections) > top_n:
+        st.caption(f"Showing the {top_n} most overdue of {len(filtered_collections)} matching accounts")
     
-    # Color code by risk level
-    def risk_color(row):
-        if row['Days Overdue'] > 90:
-            return ['background-color: #ffcccc'] * len(row)
-        elif row['Days Overdue'] > 60:
-            return ['background-color: #ffe6cc'] * len(row)
-        elif row['Days Overdue'] > 30:
-            return ['background-color: #ffffcc'] * len(row)
-        else:
-            return ['background-color: #ccffcc'] * len(row)
+    # Color code by risk level, one style per row picked with numpy
+    def risk_colors(df):
+        days = df['Days Overdue'].to_numpy()
+        row_colors = np.select(
+            [days > 90, days > 60, days > 30],
+            ['background-color: #ffcccc', 'background-color: #ffe6cc', 'background-color: #ffffcc'],
+            default='background-color: #ccffcc'
+        )
+        return pd.DataFrame(np.repeat(row_colors[:, None], df.shape[1], axis=1), index=df.index, columns=df.columns)
     
-    styled_df = display_df.style.apply(risk_color, axis=1)
-    st.dataframe(styled_df, use_container_width=True)
+    styled_df = display_df.style.apply(risk_colors, axis=None)
+    st.dataframe(
+        styled_df,
+        column_config={'Outstanding': st.column_config.NumberColumn('Outstanding', format='euro')},
+        use_container_width=True
+    )
 
 else:
     st.info("No accounts currently in collections.")
 
-db.close()
 
 # Sidebar information
 with st.sidebar:
@@ -1,7 +1,4 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import os
 import sys
@@ -44,10 +41,9 @@ with st.sidebar:
     
     st.markdown("### 📋 Available Tables")
     try:
-        tables = sql_chat.get_table_names()
-        for table in tables:
+        table_columns = sql_chat.get_all_table_columns()
+        for table, columns in table_columns.items():
             with st.expander(f"📄 {table}"):
-                columns = sql_chat.get_table_columns(table)
                 for col in columns:
                     icon = "🔑" if col["primary_key"] else "📝"
                     st.write(f"{icon} **{col['name']}** ({col['type']})")
@@ -134,6 +130,8 @@ with col2:
                     if result["success"]:
                         st.success("Query executed successfully!")
                         if not result["data"].empty:
+                            if result["truncated"]:
+                                st.caption(f"Showing the first {len(result['data'])} rows")
                             st.dataframe(result["data"], use_container_width=True)
                         else:
                             st.info("Query returned no results.")
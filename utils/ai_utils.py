@@ -1,16 +1,70 @@
-import openai
 import os
 from dotenv import load_dotenv
+import hashlib
 import json
+import orjson
 import sqlite3
-from datetime import datetime
-import pandas as pd
+from collections import OrderedDict
+from functools import lru_cache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from utils.database import open_connection
+from utils.sentiment import load_sentiment_model
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Model used by every assistant method
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Upper bound (seconds) on a single OpenAI request
+REQUEST_TIMEOUT = 30
+
+# Attempts per OpenAI request when it fails with a rate limit, timeout or connection error
+MAX_ATTEMPTS = 5
+
+# Texts scored per request by analyze_sentiment_batch
+SENTIMENT_BATCH_SIZE = 20
+
+# Completions kept in memory per assistant; older ones are still read back from
+# the completions_cache table in lending.db
+COMPLETION_CACHE_SIZE = 1024
+
+# Upper bound (tokens) on customer/statement data embedded in a single prompt
+PROMPT_DATA_TOKEN_BUDGET = 3000
+
+# TEXT columns holding JSON documents; get_customer_data returns them decoded
+JSON_TEXT_COLUMNS = ("factors", "statement_data", "risk_indicators", "payment_plan")
+
+@lru_cache(maxsize=None)
+def _prompt_encoding():
+    import tiktoken
+    return tiktoken.encoding_for_model(DEFAULT_MODEL)
+
+def to_prompt_json(data, max_tokens=PROMPT_DATA_TOKEN_BUDGET):
+    """Serialize data compactly for embedding in a prompt, truncated to max_tokens"""
+    # Sorted keys give the same prompt, and so the same completion cache key, for equal data
+    payload = orjson.dumps(data, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS).decode()
+    # A token covers at least one byte, so payloads within budget in bytes never need encoding
+    if len(payload.encode()) <= max_tokens:
+        return payload
+    tokens = _prompt_encoding().encode(payload)
+    if len(tokens) <= max_tokens:
+        return payload
+    return _prompt_encoding().decode(tokens[:max_tokens]) + " ...[truncated]"
+
+def _is_transient(exc):
+    """Errors worth retrying: rate limits, timeouts and dropped connections"""
+    import openai
+    return isinstance(exc, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError))
+
+# Exponential backoff (1s doubling up to 30s) on transient errors; anything else,
+# or the last transient error, is raised to the caller unchanged
+retry_transient = retry(
+    stop=stop_after_attempt(MAX_ATTEMPTS),
+    wait=wait_exponential(min=1, max=30),
+    retry=retry_if_exception(_is_transient),
+    reraise=True
+)
 
 class AILendingAssistant:
     def __init__(self, db_path=None):
@@ -20,16 +74,124 @@ class AILendingAssistant:
             self.db_path = os.path.join(project_root, 'db', 'lending.db')
         else:
             self.db_path = db_path
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Imported here so importing this module stays cheap; only clients need openai
+        import openai
+        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=REQUEST_TIMEOUT, max_retries=0)
+        self._completion_cache = OrderedDict()
+        self._completion_table_ready = False
+        self._customer_data_sql = None
+        self._conn = None
+        # Local sentiment model (ONNX or VADER) when installed; None falls back to the API
+        self.sentiment_model = load_sentiment_model()
     
     def get_db_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get the assistant's database connection, opened on first use"""
+        # Held for the assistant's lifetime like LendingDatabase's, so customer
+        # lookups and completion cache reads don't reopen the file and rerun the pragmas
+        if self._conn is None:
+            self._conn = open_connection(self.db_path)
+        return self._conn
     
-    def kyc_kyb_chat(self, message, customer_type="individual", conversation_history=None):
-        """Handle KYC/KYB chat interactions"""
+    def _completion_key(self, messages, model, temperature, max_tokens, kwargs):
+        payload = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "options": kwargs
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _cached_completion(self, key):
+        """Look up a completion in memory, then in the completions_cache table"""
+        if key in self._completion_cache:
+            self._completion_cache.move_to_end(key)
+            return self._completion_cache[key]
+        try:
+            conn = self.get_db_connection()
+            self._ensure_completion_table(conn)
+            row = conn.execute("SELECT response FROM completions_cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        self._remember_completion(key, row[0])
+        return row[0]
+    
+    def _store_completion(self, key, content):
+        self._remember_completion(key, content)
+        try:
+            conn = self.get_db_connection()
+            self._ensure_completion_table(conn)
+            conn.execute("INSERT OR REPLACE INTO completions_cache (key, response) VALUES (?, ?)", (key, content))
+        except sqlite3.Error:
+            pass
+    
+    def _remember_completion(self, key, content):
+        self._completion_cache[key] = content
+        self._completion_cache.move_to_end(key)
+        if len(self._completion_cache) > COMPLETION_CACHE_SIZE:
+            self._completion_cache.popitem(last=False)
+    
+    def _ensure_completion_table(self, conn):
+        if not self._completion_table_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self._completion_table_ready = True
+    
+    @retry_transient
+    def _create_completion(self, **params):
+        """chat.completions.create with retries on transient errors"""
+        return self.client.chat.completions.create(**params)
+    
+    def _complete(self, messages, model=DEFAULT_MODEL, temperature=0.7, max_tokens=500, **kwargs):
+        """Run a chat completion and return the message content, reusing cached responses for identical requests"""
+        key = self._completion_key(messages, model, temperature, max_tokens, kwargs)
+        cached = self._cached_completion(key)
+        if cached is not None:
+            return cached
+        
+        response = self._create_completion(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        content = response.choices[0].message.content
+        self._store_completion(key, content)
+        return content
+    
+    def _complete_stream(self, messages, model=DEFAULT_MODEL, temperature=0.7, max_tokens=500):
+        """Yield the completion as it is generated; cached responses are yielded whole"""
+        key = self._completion_key(messages, model, temperature, max_tokens, {})
+        cached = self._cached_completion(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        stream = self._create_completion(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            yield delta
+        self._store_completion(key, "".join(parts))
+    
+    def _kyc_kyb_messages(self, message, customer_type, conversation_history):
         if conversation_history is None:
             conversation_history = []
         
@@ -58,20 +220,25 @@ class AILendingAssistant:
         messages = [{"role": "system", "content": system_prompt}]
         messages.extend(conversation_history)
         messages.append({"role": "user", "content": message})
-        
+        return messages
+    
+    def kyc_kyb_chat(self, message, customer_type="individual", conversation_history=None):
+        """Handle KYC/KYB chat interactions"""
+        messages = self._kyc_kyb_messages(message, customer_type, conversation_history)
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
-            )
-            return response.choices[0].message.content
+            return self._complete(messages, temperature=0.7, max_tokens=500)
         except Exception as e:
             return f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
     
-    def analyze_bank_statement(self, statement_data):
-        """Analyze bank statement for credit assessment"""
+    def kyc_kyb_chat_stream(self, message, customer_type="individual", conversation_history=None):
+        """Streaming variant of kyc_kyb_chat, for st.write_stream"""
+        messages = self._kyc_kyb_messages(message, customer_type, conversation_history)
+        try:
+            yield from self._complete_stream(messages, temperature=0.7, max_tokens=500)
+        except Exception as e:
+            yield f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
+    
+    def _bank_statement_messages(self, statement_data):
         system_prompt = """
         You are a credit analyst specializing in bank statement analysis for lending decisions.
         Analyze the provided bank statement data and provide insights on:
@@ -85,22 +252,20 @@ class AILendingAssistant:
         Provide a structured analysis with risk score (1-10, where 1 is lowest risk) and recommendations.
         """
         
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Analyze this bank statement data: {to_prompt_json(statement_data)}"}
+        ]
+    
+    def analyze_bank_statement(self, statement_data):
+        """Analyze bank statement for credit assessment"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Analyze this bank statement data: {json.dumps(statement_data, indent=2)}"}
-                ],
-                temperature=0.3,
-                max_tokens=800
-            )
-            return response.choices[0].message.content
+            messages = self._bank_statement_messages(statement_data)
+            return self._complete(messages, temperature=0.3, max_tokens=800)
         except Exception as e:
             return f"Error analyzing bank statement: {str(e)}"
     
-    def generate_marketing_content(self, campaign_type, target_audience, channel, custom_prompt=""):
-        """Generate marketing content using AI"""
+    def _marketing_messages(self, campaign_type, target_audience, channel, custom_prompt):
         system_prompt = f"""
         You are a marketing specialist for a European lending institution.
         Create compelling marketing content for {campaign_type} targeting {target_audience} for {channel} channel.
@@ -115,22 +280,20 @@ class AILendingAssistant:
         {custom_prompt}
         """
         
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Generate marketing content for {campaign_type}"}
+        ]
+    
+    def generate_marketing_content(self, campaign_type, target_audience, channel, custom_prompt=""):
+        """Generate marketing content using AI"""
+        messages = self._marketing_messages(campaign_type, target_audience, channel, custom_prompt)
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Generate marketing content for {campaign_type}"}
-                ],
-                temperature=0.8,
-                max_tokens=600
-            )
-            return response.choices[0].message.content
+            return self._complete(messages, temperature=0.8, max_tokens=600)
         except Exception as e:
             return f"Error generating marketing content: {str(e)}"
     
-    def customer_service_chat(self, customer_message, customer_context=None):
-        """Handle customer service inquiries"""
+    def _customer_service_messages(self, customer_message, customer_context):
         system_prompt = """
         You are a helpful customer service representative for a European lending institution.
         Provide professional, empathetic, and accurate responses to customer inquiries.
@@ -148,24 +311,30 @@ class AILendingAssistant:
         
         context_info = ""
         if customer_context:
-            context_info = f"Customer context: {json.dumps(customer_context, indent=2)}"
+            context_info = f"Customer context: {to_prompt_json(customer_context)}"
         
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{context_info}\n\nCustomer message: {customer_message}"}
+        ]
+    
+    def customer_service_chat(self, customer_message, customer_context=None):
+        """Handle customer service inquiries"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"{context_info}\n\nCustomer message: {customer_message}"}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            return response.choices[0].message.content
+            messages = self._customer_service_messages(customer_message, customer_context)
+            return self._complete(messages, temperature=0.7, max_tokens=500)
         except Exception as e:
             return f"I apologize for the technical issue. Please contact our support team directly. Error: {str(e)}"
     
-    def generate_collection_email(self, customer_data, collection_stage, outstanding_amount, days_overdue):
-        """Generate collection emails based on stage and customer data"""
+    def customer_service_chat_stream(self, customer_message, customer_context=None):
+        """Streaming variant of customer_service_chat, for st.write_stream"""
+        try:
+            messages = self._customer_service_messages(customer_message, customer_context)
+            yield from self._complete_stream(messages, temperature=0.7, max_tokens=500)
+        except Exception as e:
+            yield f"I apologize for the technical issue. Please contact our support team directly. Error: {str(e)}"
+    
+    def _collection_email_messages(self, customer_data, collection_stage, outstanding_amount, days_overdue):
         stage_prompts = {
             "early": "Generate a friendly reminder email for early-stage collections (15-30 days overdue)",
             "mid": "Generate a more formal collection email for mid-stage collections (31-60 days overdue)",
@@ -184,77 +353,112 @@ class AILendingAssistant:
         - Include clear next steps and contact information
         - Maintain empathetic tone while being firm about obligations
         
-        Customer details: {json.dumps(customer_data, indent=2)}
+        Customer details: {to_prompt_json(customer_data)}
         Outstanding amount: €{outstanding_amount}
         Days overdue: {days_overdue}
         """
         
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Generate a {collection_stage} stage collection email"}
+        ]
+    
+    def generate_collection_email(self, customer_data, collection_stage, outstanding_amount, days_overdue):
+        """Generate collection emails based on stage and customer data"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Generate a {collection_stage} stage collection email"}
-                ],
-                temperature=0.6,
-                max_tokens=600
-            )
-            return response.choices[0].message.content
+            messages = self._collection_email_messages(customer_data, collection_stage, outstanding_amount, days_overdue)
+            return self._complete(messages, temperature=0.6, max_tokens=600)
         except Exception as e:
             return f"Error generating collection email: {str(e)}"
     
-    def analyze_sentiment(self, text):
-        """Analyze sentiment of customer messages"""
+    def _sentiment_batch_messages(self, texts):
         system_prompt = """
-        Analyze the sentiment of the following text and return a score between -1 (very negative) and 1 (very positive).
+        Analyze the sentiment of each numbered text and return a score between -1 (very negative) and 1 (very positive).
         Also provide a brief explanation of the sentiment.
-        Return the response as JSON with 'score' and 'explanation' fields.
+        Return the response as a JSON object with a 'results' array where element i has 'score' and 'explanation' fields for text [i].
         """
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.3,
-                max_tokens=200
-            )
+        numbered_texts = "\n".join(f"[{i}] {text}" for i, text in enumerate(texts))
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": numbered_texts}
+        ]
+    
+    def analyze_sentiment(self, text):
+        """Analyze sentiment of customer messages"""
+        return self.analyze_sentiment_batch([text])[0]
+    
+    def analyze_sentiment_batch(self, texts):
+        """Analyze sentiment of several messages with one request per SENTIMENT_BATCH_SIZE texts"""
+        if self.sentiment_model is not None:
+            return self.sentiment_model.score(texts) if texts else []
+        results = []
+        for start in range(0, len(texts), SENTIMENT_BATCH_SIZE):
+            batch = texts[start:start + SENTIMENT_BATCH_SIZE]
+            messages = self._sentiment_batch_messages(batch)
+            try:
+                content = self._complete(
+                    messages,
+                    temperature=0.3,
+                    max_tokens=100 * len(batch),
+                    response_format={"type": "json_object"}
+                )
+                batch_results = orjson.loads(content)["results"]
+                if len(batch_results) != len(batch):
+                    raise ValueError(f"expected {len(batch)} results, got {len(batch_results)}")
+            except Exception as e:
+                batch_results = [
+                    {"score": 0.0, "explanation": f"Error analyzing sentiment: {str(e)}"} for _ in batch
+                ]
+            results.extend(batch_results)
+        return results
+    
+    def _customer_data_query(self, conn):
+        """Single-statement lookup of a customer with its KYC rows, latest score and latest statement"""
+        if self._customer_data_sql is None:
+            # json_object() needs explicit columns; read them from the schema once
+            def row_json(table, alias):
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                return "json_object(" + ", ".join(f"'{column}', {column_json(alias, column)}" for column in columns) + ")"
             
-            result = json.loads(response.choices[0].message.content)
-            return result
-        except Exception as e:
-            return {"score": 0.0, "explanation": f"Error analyzing sentiment: {str(e)}"}
+            # Nest JSON text columns as objects so they are decoded with the row, not per use
+            def column_json(alias, column):
+                if column not in JSON_TEXT_COLUMNS:
+                    return f"{alias}.{column}"
+                return f"CASE WHEN json_valid({alias}.{column}) THEN json({alias}.{column}) ELSE {alias}.{column} END"
+            
+            self._customer_data_sql = f"""
+                SELECT c.*,
+                    COALESCE(c.company_name, c.first_name || ' ' || c.last_name) AS display_name,
+                    (SELECT json_group_array({row_json('kyc_kyb_data', 'k')})
+                     FROM kyc_kyb_data k WHERE k.customer_id = c.id) AS kyc_json,
+                    (SELECT {row_json('credit_scores', 'cs')}
+                     FROM credit_scores cs WHERE cs.customer_id = c.id
+                     ORDER BY cs.score_date DESC LIMIT 1) AS credit_json,
+                    (SELECT {row_json('bank_statements', 'bs')}
+                     FROM bank_statements bs WHERE bs.customer_id = c.id
+                     ORDER BY bs.statement_date DESC LIMIT 1) AS statement_json
+                FROM customers c
+                WHERE c.id = ?
+            """
+        return self._customer_data_sql
     
     def get_customer_data(self, customer_id):
         """Retrieve customer data for AI context"""
         conn = self.get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get customer basic info
-        cursor.execute("SELECT * FROM customers WHERE id = ?", (customer_id,))
-        customer = cursor.fetchone()
+        row = conn.execute(self._customer_data_query(conn), (customer_id,)).fetchone()
         
-        if not customer:
+        if not row:
             return None
         
-        # Get additional data
-        cursor.execute("SELECT * FROM kyc_kyb_data WHERE customer_id = ?", (customer_id,))
-        kyc_data = cursor.fetchall()
-        
-        cursor.execute("SELECT * FROM credit_scores WHERE customer_id = ? ORDER BY score_date DESC LIMIT 1", (customer_id,))
-        credit_score = cursor.fetchone()
-        
-        cursor.execute("SELECT * FROM bank_statements WHERE customer_id = ? ORDER BY statement_date DESC LIMIT 1", (customer_id,))
-        bank_statement = cursor.fetchone()
-        
-        conn.close()
+        customer = dict(row)
+        kyc_json = customer.pop("kyc_json")
+        credit_json = customer.pop("credit_json")
+        statement_json = customer.pop("statement_json")
         
         return {
-            "customer": dict(customer),
-            "kyc_data": [dict(row) for row in kyc_data],
-            "credit_score": dict(credit_score) if credit_score else None,
-            "bank_statement": dict(bank_statement) if bank_statement else None
+            "customer": customer,
+            "kyc_data": orjson.loads(kyc_json),
+            "credit_score": orjson.loads(credit_json) if credit_json else None,
+            "bank_statement": orjson.loads(statement_json) if statement_json else None
         }
-
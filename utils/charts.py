@@ -0,0 +1,44 @@
+import numpy as np
+import plotly.graph_objects as go
+
+def risk_heatmap(days_overdue, outstanding, title, nbins=30):
+    """Collections risk heatmap binned server-side with numpy"""
+    # Only the bin counts are sent to the browser, so the figure stays the same
+    # size however many collections rows there are
+    counts, x_edges, y_edges = np.histogram2d(days_overdue, outstanding, bins=nbins)
+    fig = go.Figure(go.Heatmap(
+        z=counts.T,
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        colorbar=dict(title="Count"),
+        hovertemplate="Days Overdue: %{x:.0f}<br>Outstanding: €%{y:,.0f}<br>Count: %{z}<extra></extra>"
+    ))
+    fig.update_layout(
+        title=title,
+        xaxis_title="Days Overdue",
+        yaxis_title="Outstanding Amount (€)"
+    )
+    return fig
+
+def binned_histogram(values, title, x_label, y_label="Number of Customers", nbins=20, bin_range=None):
+    """Histogram binned server-side with numpy instead of by Plotly in the browser"""
+    # A fixed bin_range keeps bin edges stable as values are added
+    counts, edges = np.histogram(values, bins=nbins, range=bin_range)
+    return histogram_bars(counts, edges, title, x_label, y_label)
+
+def histogram_bars(counts, edges, title, x_label, y_label="Number of Customers"):
+    """Histogram drawn from precomputed bin counts, e.g. aggregated in SQL"""
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate="%{customdata[0]:.0f} - %{customdata[1]:.0f}: %{y}<extra></extra>"
+    ))
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_label,
+        yaxis_title=y_label,
+        bargap=0
+    )
+    return fig
@@ -5,13 +5,23 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, roc_auc_score
 import sqlite3
-import json
+import orjson
 import pickle
 import os
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+# Country risk (simplified)
+COUNTRY_RISK = {
+    'Germany': 0.1, 'France': 0.15, 'Italy': 0.2, 
+    'Spain': 0.25, 'Poland': 0.3, 'Netherlands': 0.05
+}
+
+# Minimum credit score for each risk level, best first; lower scores are DEFAULT_RISK_LEVEL
+RISK_LEVELS = ((740, 'Low Risk'), (670, 'Medium-Low Risk'), (580, 'Medium Risk'))
+DEFAULT_RISK_LEVEL = 'High Risk'
+
 class CreditScoringModel:
     """
     Advanced credit scoring model using logistic regression
@@ -52,7 +62,7 @@ class CreditScoringModel:
         # Risk indicators
         risk_data = bank_data.get('risk_indicators', {})
         if isinstance(risk_data, str):
-            risk_data = json.loads(risk_data)
+            risk_data = orjson.loads(risk_data)
         
         features['overdrafts'] = risk_data.get('overdrafts', 0)
         features['returned_payments'] = risk_data.get('returned_payments', 0)
@@ -64,11 +74,39 @@ class CreditScoringModel:
         features['existing_credit_score'] = credit_data.get('score', 650) if credit_data else 650
         
         # Country risk (simplified)
-        country_risk_map = {
-            'Germany': 0.1, 'France': 0.15, 'Italy': 0.2, 
-            'Spain': 0.25, 'Poland': 0.3, 'Netherlands': 0.05
-        }
-        features['country_risk'] = country_risk_map.get(customer_data.get('country', 'Germany'), 0.2)
+        features['country_risk'] = COUNTRY_RISK.get(customer_data.get('country', 'Germany'), 0.2)
+        
+        return features
+    
+    def prepare_features_batch(self, df):
+        """
+        Vectorized prepare_features over a frame with one row per customer
+        """
+        # Columns mirror the customer_data keys; missing columns and NULLs take the same defaults
+        def column(name, default):
+            return df[name].fillna(default) if name in df else pd.Series(default, index=df.index)
+        
+        features = pd.DataFrame(index=df.index)
+        features['age'] = column('age', 35)
+        features['is_business'] = (column('customer_type', '') == 'business').astype(int)
+        
+        features['monthly_income'] = column('monthly_income', 0)
+        features['monthly_expenses'] = column('monthly_expenses', 0)
+        features['current_balance'] = column('balance', 0)
+        
+        income = features['monthly_income']
+        has_income = income > 0
+        safe_income = income.where(has_income, 1)
+        features['expense_to_income_ratio'] = np.where(has_income, features['monthly_expenses'] / safe_income, 1.0)
+        features['savings_rate'] = np.where(has_income, (income - features['monthly_expenses']) / safe_income, 0.0)
+        
+        features['overdrafts'] = column('overdrafts', 0)
+        features['returned_payments'] = column('returned_payments', 0)
+        features['gambling_transactions'] = column('gambling_transactions', 0).astype(bool).astype(int)
+        features['irregular_income'] = column('irregular_income', 0).astype(bool).astype(int)
+        
+        features['existing_credit_score'] = column('existing_credit_score', 650)
+        features['country_risk'] = column('country', 'Germany').map(COUNTRY_RISK).fillna(0.2)
         
         return features
     
@@ -274,18 +312,35 @@ class CreditScoringModel:
             'model_version': '1.0'
         }
     
+    def predict_batch(self, df):
+        """
+        Predict credit scores for every row of df with one predict_proba call
+        """
+        if not self.is_trained:
+            self.train_model()
+        
+        features = self.prepare_features_batch(df).reindex(columns=self.feature_names, fill_value=0)
+        good_credit_prob = self.model.predict_proba(self.scaler.transform(features))[:, 1]
+        credit_score = np.round(300 + good_credit_prob * 550).astype(int)
+        
+        return pd.DataFrame({
+            'credit_score': credit_score,
+            'good_credit_probability': good_credit_prob,
+            'risk_level': np.select(
+                [credit_score >= cutoff for cutoff, _ in RISK_LEVELS],
+                [level for _, level in RISK_LEVELS],
+                default=DEFAULT_RISK_LEVEL
+            )
+        }, index=df.index)
+    
     def _get_risk_level(self, credit_score):
         """
         Determine risk level based on credit score
         """
-        if credit_score >= 740:
-            return 'Low Risk'
-        elif credit_score >= 670:
-            return 'Medium-Low Risk'
-        elif credit_score >= 580:
-            return 'Medium Risk'
-        else:
-            return 'High Risk'
+        for cutoff, level in RISK_LEVELS:
+            if credit_score >= cutoff:
+                return level
+        return DEFAULT_RISK_LEVEL
     
     def get_model_insights(self):
         """
@@ -1,8 +1,116 @@
 import sqlite3
 import os
+import threading
 from datetime import datetime, timedelta
-import random
-import json
+import numpy as np
+import orjson
+import pandas as pd
+
+# Applied to every new connection: WAL so readers don't block writers, a larger
+# page cache and memory-mapped reads for the dashboard's repeated queries, and
+# enforcement of the customer_id foreign keys (off by default in SQLite).
+# page_size only takes effect on a new, empty database file.
+CONNECTION_PRAGMAS = """
+    PRAGMA page_size=8192;
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA foreign_keys=ON;
+"""
+
+# Indexes on the columns the pages filter and sort by; the (customer_id, date)
+# pairs serve the "latest row per customer" lookups directly.
+INDEXES = {
+    "idx_cust_type": "customers(customer_type)",
+    "idx_kyc_status": "kyc_kyb_data(verification_status)",
+    "idx_kyc_customer": "kyc_kyb_data(customer_id)",
+    # Covers the recent verifications listing: newest rows read straight from the index
+    "idx_kyc_recent": "kyc_kyb_data(created_at DESC, customer_display_name, verification_type, verification_status, risk_score)",
+    "idx_credit_cust_date": "credit_scores(customer_id, score_date DESC)",
+    # Covers the score history on the Credit Scoring page, read in date order without a sort
+    "idx_credit_date": "credit_scores(score_date DESC, customer_id, score)",
+    "idx_bank_cust_date": "bank_statements(customer_id, statement_date DESC)",
+    "idx_campaigns_status": "marketing_campaigns(status)",
+    "idx_cs_created": "customer_service(created_at DESC)",
+    "idx_cs_customer": "customer_service(customer_id)",
+    "idx_collections_overdue": "collections(days_overdue DESC)",
+    "idx_collections_customer": "collections(customer_id)",
+    "idx_collections_stage": "collections(collection_stage)",
+}
+
+# dict parameters are bound as JSON text, so the JSON columns can be passed as dicts
+sqlite3.register_adapter(dict, lambda value: orjson.dumps(value).decode())
+
+# Fixed seed so every freshly populated demo database holds the same data
+DEMO_DATA_SEED = 42
+
+# sqlite3 reuses a prepared statement when the exact SQL text is executed again on
+# the same connection; keep query strings constant so repeated reruns hit this cache
+STATEMENT_CACHE_SIZE = 256
+
+# Indexes superseded by an entry in INDEXES; dropped from existing databases
+RETIRED_INDEXES = ("idx_kyc_created",)
+
+# Read-side views over the joins the pages display; created alongside the indexes
+VIEWS = {
+    "v_recent_verifications": """
+        SELECT customer_display_name AS customer,
+               verification_type AS type,
+               verification_status AS status,
+               risk_score,
+               created_at
+        FROM kyc_kyb_data
+    """,
+}
+
+# External-content FTS5 indexes over free-text columns, kept in sync by triggers:
+# name -> (table, indexed columns). unicode61 folds the accents in the EU demo data.
+SEARCH_INDEXES = {
+    "kyc_notes_fts": ("kyc_kyb_data", ("verification_notes",)),
+    "collections_notes_fts": ("collections", ("collection_notes", "ai_generated_email")),
+}
+
+# Columns added after the initial schema: (table, column, type, backfill statement)
+ADDED_COLUMNS = [
+    ("kyc_kyb_data", "customer_display_name", "TEXT", """
+        UPDATE kyc_kyb_data SET customer_display_name = (
+            SELECT COALESCE(c.company_name, c.first_name || ' ' || c.last_name)
+            FROM customers c WHERE c.id = kyc_kyb_data.customer_id
+        )
+    """),
+]
+
+# Triggers keeping denormalized columns in step with their source rows: name -> definition.
+# Rows inserted without a customer_display_name get it from customers, and renaming
+# a customer rewrites the copies on its kyc_kyb_data rows.
+TRIGGERS = {
+    "kyc_display_name_ai": """
+        AFTER INSERT ON kyc_kyb_data WHEN new.customer_display_name IS NULL BEGIN
+            UPDATE kyc_kyb_data SET customer_display_name = (
+                SELECT COALESCE(c.company_name, c.first_name || ' ' || c.last_name)
+                FROM customers c WHERE c.id = new.customer_id
+            ) WHERE id = new.id;
+        END
+    """,
+    "customers_display_name_au": """
+        AFTER UPDATE OF first_name, last_name, company_name ON customers BEGIN
+            UPDATE kyc_kyb_data SET customer_display_name = COALESCE(new.company_name, new.first_name || ' ' || new.last_name)
+            WHERE customer_id = new.id;
+        END
+    """,
+}
+
+def open_connection(db_path):
+    """Open a tuned SQLite connection returning sqlite3.Row rows"""
+    # Autocommit: a connection shared between Streamlit sessions must not sit in
+    # an implicit transaction opened by one of them
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.executescript(CONNECTION_PRAGMAS)
+    conn.row_factory = sqlite3.Row
+    return conn
 
 class LendingDatabase:
     def __init__(self, db_path=None):
@@ -13,22 +121,60 @@ class LendingDatabase:
         else:
             self.db_path = db_path
         self.conn = None
-        
+        # Streamlit sessions share one connection; explicit transactions and
+        # writes hold this lock so another session's statements can't land inside them
+        self.write_lock = threading.Lock()
+    
     def connect(self):
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
+        """Return the shared connection, opening it on first use"""
+        if self.conn is not None:
+            return self.conn
+        self.conn = open_connection(self.db_path)
+        # Databases created before these columns, triggers, indexes and views existed pick them up here
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'collections'").fetchone():
+            self.add_missing_columns()
+            self.create_triggers()
+            self.create_indexes()
+            self.create_views()
+            self.create_search_indexes()
+            self.create_rollups()
         return self.conn
     
     def close(self):
         if self.conn:
             self.conn.close()
+            self.conn = None
+    
+    def query_df(self, sql, params=(), **kwargs):
+        """Run a query on the shared connection and return the result as a DataFrame"""
+        return pd.read_sql_query(sql, self.connect(), params=params, **kwargs)
+    
+    def execute_write(self, sql, params=()):
+        """Run a single INSERT/UPDATE/DELETE on the shared connection"""
+        with self.write_lock:
+            return self.connect().execute(sql, params).rowcount
+    
+    def query_one(self, sql, params=()):
+        """Run a query and return its first row as a tuple, or None"""
+        row = self.connect().execute(sql, params).fetchone()
+        return tuple(row) if row is not None else None
+    
+    def last_modified(self):
+        """Modification time of the database, used as a cache key"""
+        # In WAL mode commits land in the -wal file until the next checkpoint
+        wal_path = self.db_path + '-wal'
+        mtime = os.path.getmtime(self.db_path)
+        if os.path.exists(wal_path):
+            mtime = max(mtime, os.path.getmtime(wal_path))
+        return mtime
     
     def create_tables(self):
         """Create all database tables"""
-        cursor = self.conn.cursor()
-        
-        # Customers table
-        cursor.execute('''
+        # One script and one transaction for the whole schema
+        self.conn.executescript('''
+            BEGIN;
+            
+            -- Customers table
             CREATE TABLE IF NOT EXISTS customers (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_type TEXT CHECK(customer_type IN ('individual', 'business')) NOT NULL,
@@ -46,11 +192,9 @@ class LendingDatabase:
                 registration_number TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # KYC/KYB data table
-        cursor.execute('''
+            );
+            
+            -- KYC/KYB data table
             CREATE TABLE IF NOT EXISTS kyc_kyb_data (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_id INTEGER,
@@ -60,14 +204,13 @@ class LendingDatabase:
                 verification_status TEXT CHECK(verification_status IN ('pending', 'approved', 'rejected')) DEFAULT 'pending',
                 risk_score REAL,
                 verification_notes TEXT,
+                customer_display_name TEXT, -- copied from customers so listings need no join
                 verified_at TIMESTAMP,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-        ''')
-        
-        # Credit scores table
-        cursor.execute('''
+            );
+            
+            -- Credit scores table
             CREATE TABLE IF NOT EXISTS credit_scores (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_id INTEGER,
@@ -77,11 +220,9 @@ class LendingDatabase:
                 factors TEXT, -- JSON string of factors affecting score
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-        ''')
-        
-        # Bank statements table
-        cursor.execute('''
+            );
+            
+            -- Bank statements table
             CREATE TABLE IF NOT EXISTS bank_statements (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_id INTEGER,
@@ -96,11 +237,9 @@ class LendingDatabase:
                 risk_indicators TEXT, -- JSON string of risk factors
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-        ''')
-        
-        # Marketing campaigns table
-        cursor.execute('''
+            );
+            
+            -- Marketing campaigns table
             CREATE TABLE IF NOT EXISTS marketing_campaigns (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 campaign_name TEXT NOT NULL,
@@ -113,11 +252,9 @@ class LendingDatabase:
                 budget REAL,
                 status TEXT CHECK(status IN ('draft', 'active', 'paused', 'completed')) DEFAULT 'draft',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Customer service interactions table
-        cursor.execute('''
+            );
+            
+            -- Customer service interactions table
             CREATE TABLE IF NOT EXISTS customer_service (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_id INTEGER,
@@ -131,11 +268,9 @@ class LendingDatabase:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 resolved_at TIMESTAMP,
                 FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-        ''')
-        
-        # Collections table
-        cursor.execute('''
+            );
+            
+            -- Collections table
             CREATE TABLE IF NOT EXISTS collections (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 customer_id INTEGER,
@@ -151,15 +286,173 @@ class LendingDatabase:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
+            );
+            
+            COMMIT;
         ''')
         
-        self.conn.commit()
+        self.create_triggers()
+        self.create_indexes()
+        self.create_views()
+        self.create_search_indexes()
+        self.create_rollups()
+    
+    def create_indexes(self):
+        """Create missing indexes and refresh planner statistics"""
+        existing = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        missing = [name for name in INDEXES if name not in existing]
+        retired = [name for name in RETIRED_INDEXES if name in existing]
+        if not missing and not retired:
+            return
+        self.conn.executescript("".join(
+            f"DROP INDEX IF EXISTS {name};\n" for name in retired
+        ) + "".join(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {INDEXES[name]};\n" for name in missing
+        ) + "ANALYZE;")
+    
+    def add_missing_columns(self):
+        """Add and backfill columns that older databases lack"""
+        for table, column, column_type, backfill in ADDED_COLUMNS:
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                with self.write_lock:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                        self.conn.execute(backfill)
+                    except Exception:
+                        self.conn.execute("ROLLBACK")
+                        raise
+                    self.conn.execute("COMMIT")
+    
+    def create_triggers(self):
+        """Create missing triggers from TRIGGERS"""
+        existing = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        missing = [name for name in TRIGGERS if name not in existing]
+        if not missing:
+            return
+        with self.write_lock:
+            self.conn.executescript("BEGIN;\n" + "".join(
+                f"CREATE TRIGGER IF NOT EXISTS {name} {TRIGGERS[name]};\n" for name in missing
+            ) + "COMMIT;")
+    
+    def create_views(self):
+        """Create missing views and replace ones whose definition changed"""
+        existing = dict(self.conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'").fetchall())
+        for name, select in VIEWS.items():
+            if name in existing:
+                if existing[name].endswith(select.strip()):
+                    continue
+                self.conn.execute(f"DROP VIEW {name}")
+            self.conn.execute(f"CREATE VIEW {name} AS {select}")
+    
+    def create_search_indexes(self):
+        """Create missing FTS5 indexes with their sync triggers, indexing existing rows"""
+        existing = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for name, (table, columns) in SEARCH_INDEXES.items():
+            if name in existing:
+                continue
+            column_list = ", ".join(columns)
+            new_values = ", ".join(f"new.{column}" for column in columns)
+            old_values = ", ".join(f"old.{column}" for column in columns)
+            with self.write_lock:
+                self.conn.executescript(f"""
+                    BEGIN;
+                    CREATE VIRTUAL TABLE {name} USING fts5(
+                        {column_list}, content='{table}', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    );
+                    CREATE TRIGGER {name}_ai AFTER INSERT ON {table} BEGIN
+                        INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values});
+                    END;
+                    CREATE TRIGGER {name}_ad AFTER DELETE ON {table} BEGIN
+                        INSERT INTO {name}({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                    END;
+                    CREATE TRIGGER {name}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                        INSERT INTO {name}({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values});
+                    END;
+                    INSERT INTO {name}({name}) VALUES ('rebuild');
+                    COMMIT;
+                """)
+    
+    def create_rollups(self):
+        """Create the trigger-maintained kyc_status_counts table, seeded from existing rows"""
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'kyc_status_counts'").fetchone():
+            return
+        with self.write_lock:
+            self.conn.executescript("""
+                BEGIN;
+                CREATE TABLE kyc_status_counts (
+                    verification_status TEXT PRIMARY KEY,
+                    n INTEGER NOT NULL DEFAULT 0
+                );
+                INSERT INTO kyc_status_counts (verification_status) VALUES ('approved'), ('pending'), ('rejected');
+                UPDATE kyc_status_counts SET n = (
+                    SELECT COUNT(*) FROM kyc_kyb_data k WHERE k.verification_status = kyc_status_counts.verification_status
+                );
+                CREATE TRIGGER kyc_status_counts_ai AFTER INSERT ON kyc_kyb_data BEGIN
+                    INSERT INTO kyc_status_counts (verification_status, n) VALUES (new.verification_status, 1)
+                    ON CONFLICT (verification_status) DO UPDATE SET n = n + 1;
+                END;
+                CREATE TRIGGER kyc_status_counts_ad AFTER DELETE ON kyc_kyb_data BEGIN
+                    UPDATE kyc_status_counts SET n = n - 1 WHERE verification_status = old.verification_status;
+                END;
+                CREATE TRIGGER kyc_status_counts_au AFTER UPDATE OF verification_status ON kyc_kyb_data BEGIN
+                    UPDATE kyc_status_counts SET n = n - 1 WHERE verification_status = old.verification_status;
+                    INSERT INTO kyc_status_counts (verification_status, n) VALUES (new.verification_status, 1)
+                    ON CONFLICT (verification_status) DO UPDATE SET n = n + 1;
+                END;
+                COMMIT;
+            """)
+    
+    def search_ids(self, index, text):
+        """Row ids in the index's table whose text matches every word of text (prefix match)"""
+        # Each word becomes a quoted prefix term, so user input can't break the MATCH syntax
+        terms = " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+        if not terms:
+            return []
+        return [row[0] for row in self.connect().execute(f"SELECT rowid FROM {index} WHERE {index} MATCH ?", (terms,))]
     
     def populate_demo_data(self):
         """Populate database with European demo data"""
-        cursor = self.conn.cursor()
+        # The connection autocommits, so without an explicit transaction every
+        # executemany below would commit (and fsync) on its own
+        with self.write_lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                ai_responses, ai_emails = self._insert_demo_data()
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+        
+        # AI-generated text is filled in afterwards, in its own transaction, so
+        # generating it (an LLM call outside the demo) never holds the insert open
+        self._save_ai_text(ai_responses, ai_emails)
         
+        # Statistics gathered on the empty tables in create_tables are useless to the planner
+        self.conn.execute("ANALYZE")
+    
+    def _save_ai_text(self, ai_responses, ai_emails):
+        """Write generated (text, id) pairs to customer_service.ai_response and collections.ai_generated_email"""
+        with self.write_lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("UPDATE customer_service SET ai_response = ? WHERE id = ?", ai_responses)
+                self.conn.executemany("UPDATE collections SET ai_generated_email = ? WHERE id = ?", ai_emails)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+    
+    def _inserted_ids(self, count):
+        """Ids of the rows inserted by the preceding executemany (consecutive inside a write transaction)"""
+        last_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - count + 1, last_id + 1))
+    
+    def _insert_demo_data(self):
+        """Insert the demo rows inside populate_demo_data's transaction; returns the AI text as (text, id) pairs"""
         # Demo customers (mix of individuals and businesses)
         customers_data = [
             # Individual customers
@@ -175,74 +468,98 @@ class LendingDatabase:
             ('business', None, None, 'Digital Solutions SRL', 'info@digitalsol.it', '+39-02-87654321', None, 'Italian', 'Corso Buenos Aires 15', 'Milan', '20124', 'Italy', 'MI-987654321'),
         ]
         
-        cursor.executemany('''
+        self.conn.executemany('''
             INSERT INTO customers (customer_type, first_name, last_name, company_name, email, phone, date_of_birth, nationality, address, city, postal_code, country, registration_number)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', customers_data)
         
-        # Get customer IDs for foreign key references
-        cursor.execute("SELECT id FROM customers")
-        customer_ids = [row[0] for row in cursor.fetchall()]
+        # Customer IDs for foreign key references: one executemany inside the write
+        # transaction assigns consecutive ids ending at last_insert_rowid(), so only
+        # the rows inserted here are used even if the table already held customers
+        customer_ids = self._inserted_ids(len(customers_data))
+        display_names = {
+            customer_id: company_name or f"{first_name} {last_name}"
+            for customer_id, (_, first_name, last_name, company_name, *_) in zip(customer_ids, customers_data)
+        }
+        
+        # All random columns are drawn up front, one array per column
+        rng = np.random.default_rng(DEMO_DATA_SEED)
+        today = datetime.now().date()
         
         # KYC/KYB demo data
+        statuses = rng.choice(['approved', 'approved', 'pending', 'approved'], len(customer_ids)).tolist()  # Mostly approved
+        risk_scores = rng.uniform(0.1, 0.8, len(customer_ids)).tolist()
+        doc_numbers = map("DOC{:03d}".format, customer_ids)
+        verification_notes = map("Verification notes for customer {}".format, customer_ids)
         kyc_data = []
-        for i, customer_id in enumerate(customer_ids):
+        for i, (customer_id, status, risk_score, doc_number, notes) in enumerate(
+            zip(customer_ids, statuses, risk_scores, doc_numbers, verification_notes)
+        ):
             verification_type = 'kyc' if i < 5 else 'kyb'  # First 5 are individuals
             doc_type = 'passport' if verification_type == 'kyc' else 'business_registration'
-            status = random.choice(['approved', 'approved', 'pending', 'approved'])  # Mostly approved
-            risk_score = random.uniform(0.1, 0.8)
-            
-            kyc_data.append((customer_id, verification_type, doc_type, f"DOC{customer_id:03d}", status, risk_score, f"Verification notes for customer {customer_id}"))
+            kyc_data.append((customer_id, verification_type, doc_type, doc_number, status, risk_score, notes, display_names[customer_id]))
         
-        cursor.executemany('''
-            INSERT INTO kyc_kyb_data (customer_id, verification_type, document_type, document_number, verification_status, risk_score, verification_notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+        self.conn.executemany('''
+            INSERT INTO kyc_kyb_data (customer_id, verification_type, document_type, document_number, verification_status, risk_score, verification_notes, customer_display_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', kyc_data)
         
         # Credit scores demo data
-        credit_data = []
-        for customer_id in customer_ids[:5]:  # Only for individual customers
-            score = random.randint(650, 800)
-            factors = json.dumps({
-                "payment_history": random.choice(["excellent", "good", "fair"]),
-                "credit_utilization": f"{random.randint(10, 40)}%",
-                "length_of_credit": f"{random.randint(5, 15)} years",
-                "credit_mix": random.choice(["diverse", "limited", "moderate"])
+        individual_ids = customer_ids[:5]  # Only for individual customers
+        credit_data = [
+            (customer_id, score, today, "SCHUFA", {
+                "payment_history": payment_history,
+                "credit_utilization": f"{utilization}%",
+                "length_of_credit": f"{years} years",
+                "credit_mix": credit_mix
             })
-            credit_data.append((customer_id, score, datetime.now().date(), "SCHUFA", factors))
+            for customer_id, score, payment_history, utilization, years, credit_mix in zip(
+                individual_ids,
+                rng.integers(650, 801, len(individual_ids)).tolist(),
+                rng.choice(["excellent", "good", "fair"], len(individual_ids)).tolist(),
+                rng.integers(10, 41, len(individual_ids)).tolist(),
+                rng.integers(5, 16, len(individual_ids)).tolist(),
+                rng.choice(["diverse", "limited", "moderate"], len(individual_ids)).tolist()
+            )
+        ]
         
-        cursor.executemany('''
+        self.conn.executemany('''
             INSERT INTO credit_scores (customer_id, score, score_date, bureau_name, factors)
             VALUES (?, ?, ?, ?, ?)
         ''', credit_data)
         
         # Bank statements demo data
         bank_data = []
-        for customer_id in customer_ids:
-            balance = random.uniform(5000, 50000)
-            income = random.uniform(3000, 8000)
-            expenses = random.uniform(2000, 6000)
-            transactions = random.randint(50, 200)
-            
-            statement_data = json.dumps({
+        for customer_id, balance, income, expenses, transactions, overdrafts, returned_payments, gambling, irregular in zip(
+            customer_ids,
+            rng.uniform(5000, 50000, len(customer_ids)).tolist(),
+            rng.uniform(3000, 8000, len(customer_ids)).tolist(),
+            rng.uniform(2000, 6000, len(customer_ids)).tolist(),
+            rng.integers(50, 201, len(customer_ids)).tolist(),
+            rng.integers(0, 4, len(customer_ids)).tolist(),
+            rng.integers(0, 3, len(customer_ids)).tolist(),
+            (rng.random(len(customer_ids)) < 0.5).tolist(),
+            (rng.random(len(customer_ids)) < 0.5).tolist()
+        ):
+            statement_data = {
                 "transactions": [
                     {"date": "2024-01-15", "description": "Salary", "amount": income},
                     {"date": "2024-01-16", "description": "Rent", "amount": -1200},
                     {"date": "2024-01-17", "description": "Groceries", "amount": -150},
                     {"date": "2024-01-18", "description": "Utilities", "amount": -200}
                 ]
-            })
+            }
             
-            risk_indicators = json.dumps({
-                "overdrafts": random.randint(0, 3),
-                "returned_payments": random.randint(0, 2),
-                "gambling_transactions": random.choice([True, False]),
-                "irregular_income": random.choice([True, False])
-            })
+            risk_indicators = {
+                "overdrafts": overdrafts,
+                "returned_payments": returned_payments,
+                "gambling_transactions": gambling,
+                "irregular_income": irregular
+            }
             
-            bank_data.append((customer_id, datetime.now().date(), "Deutsche Bank", "checking", balance, income, expenses, transactions, statement_data, risk_indicators))
+            bank_data.append((customer_id, today, "Deutsche Bank", "checking", balance, income, expenses, transactions, statement_data, risk_indicators))
         
-        cursor.executemany('''
+        self.conn.executemany('''
             INSERT INTO bank_statements (customer_id, statement_date, bank_name, account_type, balance, monthly_income, monthly_expenses, transaction_count, statement_data, risk_indicators)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', bank_data)
@@ -254,58 +571,87 @@ class LendingDatabase:
             ("Mortgage Awareness Campaign", "First-time home buyers", "social_media", "Your dream home awaits - competitive mortgage rates", "AI-generated: Step into homeownership with confidence through our comprehensive mortgage solutions...", "2024-01-01", "2024-12-31", 100000.0, "active"),
         ]
         
-        cursor.executemany('''
+        self.conn.executemany('''
             INSERT INTO marketing_campaigns (campaign_name, target_audience, channel, content, ai_generated_content, start_date, end_date, budget, status)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', campaigns_data)
         
         # Customer service demo data
-        service_data = []
-        for i, customer_id in enumerate(customer_ids[:6]):  # Some customers have service interactions
-            subjects = ["Loan application inquiry", "Payment schedule question", "Account access issue", "Interest rate information"]
-            messages = [
-                "I would like to know more about your personal loan options.",
-                "Can I modify my payment schedule for my existing loan?",
-                "I'm having trouble accessing my online account.",
-                "What are your current interest rates for business loans?"
-            ]
-            
-            subject = random.choice(subjects)
-            message = random.choice(messages)
-            ai_response = f"Thank you for your inquiry about {subject.lower()}. Our team will assist you with this matter."
-            sentiment = random.uniform(-0.2, 0.8)  # Mostly positive/neutral
-            
-            service_data.append((customer_id, "chat", subject, message, ai_response, sentiment, "resolved", "medium"))
+        service_ids = customer_ids[:6]  # Some customers have service interactions
+        subjects = ["Loan application inquiry", "Payment schedule question", "Account access issue", "Interest rate information"]
+        messages = [
+            "I would like to know more about your personal loan options.",
+            "Can I modify my payment schedule for my existing loan?",
+            "I'm having trouble accessing my online account.",
+            "What are your current interest rates for business loans?"
+        ]
+        service_data = [
+            (customer_id, "chat", subject, message, None, sentiment, "resolved", "medium")
+            for customer_id, subject, message, sentiment in zip(
+                service_ids,
+                rng.choice(subjects, len(service_ids)).tolist(),
+                rng.choice(messages, len(service_ids)).tolist(),
+                rng.uniform(-0.2, 0.8, len(service_ids)).tolist()  # Mostly positive/neutral
+            )
+        ]
         
-        cursor.executemany('''
+        self.conn.executemany('''
             INSERT INTO customer_service (customer_id, interaction_type, subject, message, ai_response, sentiment_score, resolution_status, priority)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', service_data)
+        ai_responses = [
+            (f"Thank you for your inquiry about {row[2].lower()}. Our team will assist you with this matter.", service_id)
+            for row, service_id in zip(service_data, self._inserted_ids(len(service_data)))
+        ]
         
         # Collections demo data
+        collection_ids = customer_ids[:4]  # Some customers in collections
+        next_action = today + timedelta(days=7)
+        contact_note = f"Customer contacted on {today}"
         collections_data = []
-        for i, customer_id in enumerate(customer_ids[:4]):  # Some customers in collections
-            outstanding = random.uniform(1000, 15000)
-            days_overdue = random.randint(15, 120)
+        email_texts = []
+        for customer_id, loan_id, outstanding, days_overdue in zip(
+            collection_ids,
+            map("LOAN{:03d}".format, collection_ids),
+            rng.uniform(1000, 15000, len(collection_ids)).tolist(),
+            rng.integers(15, 121, len(collection_ids)).tolist()
+        ):
             stage = "early" if days_overdue < 30 else "mid" if days_overdue < 60 else "late"
             
-            payment_plan = json.dumps({
+            payment_plan = {
                 "monthly_payment": outstanding / 12,
                 "duration_months": 12,
                 "interest_rate": 0.05,
                 "start_date": "2024-02-01"
-            })
+            }
             
-            ai_email = f"Dear Customer, We notice your account has an outstanding balance of €{outstanding:.2f}. Please contact us to discuss payment options."
+            email_texts.append(f"Dear Customer, We notice your account has an outstanding balance of €{outstanding:.2f}. Please contact us to discuss payment options.")
             
-            collections_data.append((customer_id, f"LOAN{customer_id:03d}", outstanding, days_overdue, stage, datetime.now().date(), (datetime.now() + timedelta(days=7)).date(), f"Customer contacted on {datetime.now().date()}", ai_email, payment_plan))
+            collections_data.append((customer_id, loan_id, outstanding, days_overdue, stage, today, next_action, contact_note, None, payment_plan))
         
-        cursor.executemany('''
+        self.conn.executemany('''
             INSERT INTO collections (customer_id, loan_id, outstanding_amount, days_overdue, collection_stage, last_contact_date, next_action_date, collection_notes, ai_generated_email, payment_plan)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', collections_data)
+        ai_emails = list(zip(email_texts, self._inserted_ids(len(collections_data))))
         
-        self.conn.commit()
+        return ai_responses, ai_emails
+    
+    def save_service_interactions(self, rows):
+        """Insert customer_service rows in one transaction"""
+        # rows: (customer_id, interaction_type, subject, message, ai_response, sentiment_score, resolution_status)
+        with self.write_lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("""
+                    INSERT INTO customer_service
+                    (customer_id, interaction_type, subject, message, ai_response, sentiment_score, resolution_status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
     
     def get_customer_summary(self):
         """Get summary statistics for dashboard"""
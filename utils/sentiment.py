@@ -0,0 +1,83 @@
+import os
+import numpy as np
+
+# Exported int8 distilBERT SST-2 model (see README); override with SENTIMENT_MODEL_DIR
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'sentiment')
+MODEL_FILES = ("model_quantized.onnx", "model.onnx")
+MAX_LENGTH = 512
+
+class OnnxSentimentModel:
+    """
+    Local sentiment classifier running a quantized distilBERT SST-2 model on CPU
+    """
+    
+    def __init__(self, model_path, tokenizer_path):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=MAX_LENGTH)
+        self.tokenizer.enable_padding()
+    
+    def score(self, texts):
+        """Score texts in one batch; returns dicts shaped like AILendingAssistant.analyze_sentiment"""
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        logits = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        
+        # SST-2 labels: 0 = negative, 1 = positive
+        scores = np.tanh(logits[:, 1] - logits[:, 0])
+        return [
+            {
+                "score": round(float(score), 3),
+                "explanation": f"{'Positive' if score >= 0 else 'Negative'} sentiment (local model)"
+            }
+            for score in scores
+        ]
+
+class VaderSentimentModel:
+    """
+    Lexicon-based sentiment scoring with VADER; no model files needed
+    """
+    
+    def __init__(self):
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        
+        self.analyzer = SentimentIntensityAnalyzer()
+    
+    def score(self, texts):
+        """Score texts; returns dicts shaped like AILendingAssistant.analyze_sentiment"""
+        results = []
+        for text in texts:
+            polarity = self.analyzer.polarity_scores(text)
+            results.append({
+                "score": polarity["compound"],
+                "explanation": (
+                    f"Positive {polarity['pos']:.0%}, neutral {polarity['neu']:.0%}, "
+                    f"negative {polarity['neg']:.0%} (VADER)"
+                )
+            })
+        return results
+
+def load_sentiment_model(model_dir=None):
+    """Load a local sentiment model: the ONNX model if exported, else VADER, else None"""
+    model_dir = model_dir or os.getenv("SENTIMENT_MODEL_DIR", DEFAULT_MODEL_DIR)
+    tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+    model_paths = [os.path.join(model_dir, name) for name in MODEL_FILES]
+    model_path = next((path for path in model_paths if os.path.exists(path)), None)
+    if model_path is not None and os.path.exists(tokenizer_path):
+        try:
+            return OnnxSentimentModel(model_path, tokenizer_path)
+        except ImportError:
+            pass
+    
+    try:
+        return VaderSentimentModel()
+    except ImportError:
+        return None
@@ -1,5 +1,4 @@
 import os
-import sqlite3
 from typing import Dict, Any, List
 from langchain_openai import ChatOpenAI
 from langchain.sql_database import SQLDatabase
@@ -9,10 +8,24 @@ from langchain.agents.agent_types import AgentType
 from langchain.schema import HumanMessage, SystemMessage
 import pandas as pd
 from dotenv import load_dotenv
+from utils.database import open_connection
 
 # Load environment variables
 load_dotenv()
 
+# Direct SQL results are capped at this many rows
+DIRECT_SQL_MAX_ROWS = 1000
+
+# Tables shown to users and to the agent. Leaves out SQLite's own tables, the FTS5
+# search indexes with their shadow tables, and the app's rollup and cache tables.
+USER_TABLES_SQL = """
+    SELECT name FROM sqlite_master
+    WHERE type = 'table'
+      AND name NOT LIKE 'sqlite_%'
+      AND name NOT LIKE '%_fts%'
+      AND name NOT IN ('kyc_status_counts', 'completions_cache')
+"""
+
 class SQLChatAssistant:
     def __init__(self, db_path=None):
         if db_path is None:
@@ -21,6 +34,12 @@ class SQLChatAssistant:
             self.db_path = os.path.join(project_root, 'db', 'lending.db')
         else:
             self.db_path = db_path
+        
+        # One connection for the direct SQL and schema helpers, held for the
+        # assistant's lifetime instead of reopened on every call. It is query-only,
+        # as direct SQL writes were never committed on the old per-call connections.
+        self.conn = open_connection(self.db_path)
+        self.conn.execute("PRAGMA query_only = ON")
             
         # Initialize OpenAI client
         self.llm = ChatOpenAI(
@@ -30,7 +49,7 @@ class SQLChatAssistant:
         )
         
         # Initialize SQL database connection
-        self.db = SQLDatabase.from_uri(f"sqlite:///{self.db_path}")
+        self.db = SQLDatabase.from_uri(f"sqlite:///{self.db_path}", include_tables=self.get_table_names())
         
         # Create SQL agent
         self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
@@ -143,13 +162,17 @@ class SQLChatAssistant:
         Execute a direct SQL query (for advanced users)
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            df = pd.read_sql_query(sql_query, conn)
-            conn.close()
+            # Only the rows that get displayed are fetched, however large the result
+            cursor = self.conn.execute(sql_query)
+            rows = cursor.fetchmany(DIRECT_SQL_MAX_ROWS + 1)
+            columns = [column[0] for column in cursor.description or ()]
+            cursor.close()
+            df = pd.DataFrame.from_records(rows[:DIRECT_SQL_MAX_ROWS], columns=columns)
             
             return {
                 "success": True,
                 "data": df,
+                "truncated": len(rows) > DIRECT_SQL_MAX_ROWS,
                 "query": sql_query,
                 "error": None
             }
@@ -165,11 +188,9 @@ class SQLChatAssistant:
     def get_table_names(self) -> List[str]:
         """Get all table names in the database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            cursor = self.conn.cursor()
+            cursor.execute(USER_TABLES_SQL)
             tables = [row[0] for row in cursor.fetchall()]
-            conn.close()
             return tables
         except Exception as e:
             return []
@@ -177,8 +198,7 @@ class SQLChatAssistant:
     def get_table_columns(self, table_name: str) -> List[Dict[str, str]]:
         """Get column information for a specific table"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self.conn.cursor()
             cursor.execute(f"PRAGMA table_info({table_name});")
             columns = []
             for row in cursor.fetchall():
@@ -188,27 +208,44 @@ class SQLChatAssistant:
                     "nullable": not row[3],
                     "primary_key": bool(row[5])
                 })
-            conn.close()
             return columns
         except Exception as e:
             return []
     
+    def get_all_table_columns(self) -> Dict[str, List[Dict[str, str]]]:
+        """Get column information for every table in one query"""
+        try:
+            rows = self.conn.execute(f"""
+                SELECT m.name, p.name, p.type, p."notnull", p.pk
+                FROM sqlite_master m
+                JOIN pragma_table_info(m.name) p
+                WHERE m.name IN ({USER_TABLES_SQL})
+                ORDER BY m.rowid, p.cid
+            """).fetchall()
+            columns = {}
+            for table, name, column_type, notnull, pk in rows:
+                columns.setdefault(table, []).append({
+                    "name": name,
+                    "type": column_type,
+                    "nullable": not notnull,
+                    "primary_key": bool(pk)
+                })
+            return columns
+        except Exception as e:
+            return {}
+    
     def get_database_stats(self) -> Dict[str, Any]:
         """Get basic statistics about the database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            stats = {}
             tables = self.get_table_names()
+            if not tables:
+                return {}
             
-            for table in tables:
-                cursor.execute(f"SELECT COUNT(*) FROM {table};")
-                count = cursor.fetchone()[0]
-                stats[table] = count
-            
-            conn.close()
-            return stats
+            # Every table's row count in one statement
+            counts_sql = " UNION ALL ".join(
+                'SELECT ?, COUNT(*) FROM "{}"'.format(table.replace('"', '""')) for table in tables
+            )
+            return dict(tuple(row) for row in self.conn.execute(counts_sql, tables))
             
         except Exception as e:
             return {}